@@ -0,0 +1,155 @@
+import gzip
+import threading
+from collections import OrderedDict
+from flask import Response, request
+
+# Optional brotli support; gzip is always available
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this (bytes) are sent uncompressed
+COMPRESSION_MIN_SIZE = 1024
+
+# Media types worth compressing
+COMPRESSIBLE_MIMETYPES = (
+    'application/json',
+    'application/msgpack',
+    'application/x-ndjson',
+    'text/csv',
+    'text/html',
+    'text/plain'
+)
+
+# Compression settings, trading a little ratio for speed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Memory budget (bytes) for compressed bodies of ETag-tagged responses
+PRECOMPRESSED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# (path, Accept, encoding) -> (etag, body, content_type, vary)
+_precompressed = OrderedDict()
+_precompressed_bytes = 0
+_precompressed_lock = threading.Lock()
+
+
+def negotiate_encoding():
+    """
+    Pick the content coding for the current request from Accept-Encoding,
+    preferring brotli when it is installed. Returns None for identity.
+    """
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(data, encoding):
+    """
+    Compress a response body with the given content coding.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+def _precompressed_key(encoding):
+    return request.full_path, request.headers.get('Accept', ''), encoding
+
+
+def get_precompressed(etag):
+    """
+    Return a ready compressed response for the current request if its body
+    was cached for this ETag, or None. Lets unchanged catalog revisions
+    skip the query, the serialization and the compression.
+    """
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return None
+    key = _precompressed_key(encoding)
+    with _precompressed_lock:
+        entry = _precompressed.get(key)
+        if entry is None or entry[0] != etag:
+            return None
+        _precompressed.move_to_end(key)
+    _, body, content_type, vary = entry
+    response = Response(body, content_type=content_type)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = vary
+    return response
+
+
+def store_precompressed(key, etag, body, content_type, vary):
+    """
+    Cache a compressed body, replacing the one kept for an older ETag and
+    evicting the least recently used bodies past the memory budget.
+    """
+    global _precompressed_bytes
+    if len(body) > PRECOMPRESSED_CACHE_MAX_BYTES:
+        return
+    with _precompressed_lock:
+        previous = _precompressed.pop(key, None)
+        if previous is not None:
+            _precompressed_bytes -= len(previous[1])
+        _precompressed[key] = (etag, body, content_type, vary)
+        _precompressed_bytes += len(body)
+        while _precompressed_bytes > PRECOMPRESSED_CACHE_MAX_BYTES:
+            _, evicted = _precompressed.popitem(last=False)
+            _precompressed_bytes -= len(evicted[1])
+
+
+def precompressed_stats():
+    """
+    Return the size of the compressed body cache for monitoring.
+    """
+    with _precompressed_lock:
+        return {
+            "entries": len(_precompressed),
+            "bytes": _precompressed_bytes,
+            "max_bytes": PRECOMPRESSED_CACHE_MAX_BYTES
+        }
+
+
+def compress_response(response):
+    """
+    after_request hook compressing buffered responses the client accepts
+    compressed. Streamed and file responses and bodies that already carry
+    a Content-Encoding (e.g. GET /books/export) are left alone. Bodies of
+    responses with an ETag are cached for get_precompressed(), and their
+    ETag is made weak since the bytes now differ from the identity body.
+    """
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    body = compress(data, encoding)
+    etag = response.get_etag()[0]
+    if etag:
+        store_precompressed(_precompressed_key(encoding), etag, body,
+                            response.content_type, response.headers['Vary'])
+        response.set_etag(etag, weak=True)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    """
+    Configure compression from app.config and register the response hook.
+    """
+    global COMPRESSION_MIN_SIZE, PRECOMPRESSED_CACHE_MAX_BYTES
+    COMPRESSION_MIN_SIZE = app.config.get('COMPRESSION_MIN_SIZE', COMPRESSION_MIN_SIZE)
+    PRECOMPRESSED_CACHE_MAX_BYTES = app.config.get(
+        'PRECOMPRESSED_CACHE_MAX_BYTES', PRECOMPRESSED_CACHE_MAX_BYTES)
+    app.after_request(compress_response)
@@ -0,0 +1,321 @@
+import json
+from crud_books_data import (
+    DATABASE_BOOKS_PATH,
+    SQLITE_INT_MAX,
+    SQLITE_INT_MIN,
+    STATIC_SCHEMA,
+    UPSERT_BOOK_SQL,
+    UPSERT_STATIC_SQL,
+    book_cache
+)
+from crud_books_static import DEFAULT_DOWNLOAD_URL, DEFAULT_PICTURE_URL, static_cache
+from db_pool import get_connection
+
+# Operations accepted by apply_book_batch()
+BATCH_OPERATIONS = ('add', 'update', 'delete')
+
+# Book and static resource fields a batch operation or imported record may carry
+BOOK_TEXT_FIELDS = ('name', 'author_name', 'category', 'description',
+                    'picture_url', 'download_url')
+
+# Maximum number of ids bound in one IN (...) lookup
+ID_LOOKUP_CHUNK = 500
+
+# Conflict policies accepted by import_ndjson()
+IMPORT_POLICIES = ('skip', 'upsert')
+
+# Records written per transaction by import_ndjson()
+IMPORT_CHUNK_SIZE = 1000
+
+# Per-line errors reported in an import summary
+IMPORT_MAX_ERRORS = 100
+
+ADD_BOOK_SQL = '''
+    INSERT INTO books (books_id, name, author_name, category, description)
+    VALUES (?, ?, ?, ?, ?)
+'''
+ADD_STATIC_SQL = f'''
+    INSERT OR REPLACE INTO {STATIC_SCHEMA}.books_static (books_id, picture_url, download_url)
+    VALUES (?, ?, ?)
+'''
+# NULL parameters leave the column unchanged, like update_book()
+UPDATE_BOOK_SQL = '''
+    UPDATE books SET name = COALESCE(?, name),
+                     author_name = COALESCE(?, author_name),
+                     category = COALESCE(?, category),
+                     description = COALESCE(?, description)
+    WHERE books_id = ?
+'''
+UPDATE_STATIC_SQL = f'''
+    UPDATE {STATIC_SCHEMA}.books_static SET picture_url = COALESCE(?, picture_url),
+                                            download_url = COALESCE(?, download_url)
+    WHERE books_id = ?
+'''
+DELETE_STATIC_SQL = f'DELETE FROM {STATIC_SCHEMA}.books_static WHERE books_id = ?'
+DELETE_BOOK_SQL = 'DELETE FROM books WHERE books_id = ?'
+
+
+def existing_book_ids(cursor, ids):
+    """
+    Return the subset of ids present in the books table.
+    """
+    ids = list(set(ids))
+    existing = set()
+    for start in range(0, len(ids), ID_LOOKUP_CHUNK):
+        chunk = ids[start:start + ID_LOOKUP_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(
+            f'SELECT books_id FROM books WHERE books_id IN ({placeholders})', chunk)
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+
+def field_error(record):
+    """
+    Return an error message if a book's id or fields could not be bound
+    by SQLite, or None. Catching these up front keeps one bad item from
+    failing the whole transaction it is written in.
+    """
+    books_id = record.get('books_id')
+    if not isinstance(books_id, int) or isinstance(books_id, bool):
+        return "books_id must be an integer"
+    if not SQLITE_INT_MIN <= books_id <= SQLITE_INT_MAX:
+        return "books_id is out of range"
+    for key in BOOK_TEXT_FIELDS:
+        if not isinstance(record.get(key), (str, type(None))):
+            return f"{key} must be a string or null"
+    return None
+
+
+def validate_operation(operation):
+    """
+    Return an error message for a malformed batch operation, or None.
+    """
+    if not isinstance(operation, dict):
+        return "Operation must be an object"
+    if operation.get('op') not in BATCH_OPERATIONS:
+        return f"op must be one of {', '.join(BATCH_OPERATIONS)}"
+    error = field_error(operation)
+    if error:
+        return error
+    if operation['op'] == 'add' and not all(operation.get(key) for key in ['name', 'author_name']):
+        return "Missing required fields"
+    return None
+
+
+def plan_batch(operations, existing):
+    """
+    Work out the outcome of each operation as if they ran in order, and
+    group consecutive accepted operations of the same kind into runs.
+    Returns (results, runs) where runs is a list of (op, [operations]).
+    """
+    results = []
+    runs = []
+    for operation in operations:
+        error = validate_operation(operation)
+        if error:
+            books_id = operation.get('books_id') if isinstance(operation, dict) else None
+            results.append({"books_id": books_id, "status": 400, "message": error})
+            continue
+
+        op = operation['op']
+        books_id = operation['books_id']
+        if op == 'add' and books_id in existing:
+            results.append({"books_id": books_id, "status": 409,
+                            "message": "Book ID already exists"})
+            continue
+        if op in ('update', 'delete') and books_id not in existing:
+            results.append({"books_id": books_id, "status": 404,
+                            "message": "Book not found"})
+            continue
+
+        if op == 'add':
+            existing.add(books_id)
+        elif op == 'delete':
+            existing.discard(books_id)
+        results.append({"books_id": books_id, "status": 201 if op == 'add' else 200})
+        if runs and runs[-1][0] == op:
+            runs[-1][1].append(operation)
+        else:
+            runs.append((op, [operation]))
+    return results, runs
+
+
+def static_row(operation):
+    """
+    Build a books_static row for an add, defaulting missing URLs like
+    add_book_static().
+    """
+    books_id = operation['books_id']
+    picture_url = operation.get('picture_url')
+    download_url = operation.get('download_url')
+    if picture_url is None:
+        picture_url = DEFAULT_PICTURE_URL.replace("books_id", str(books_id))
+    if download_url is None:
+        download_url = DEFAULT_DOWNLOAD_URL.replace("books_id", str(books_id))
+    return books_id, picture_url, download_url
+
+
+def execute_run(cursor, op, operations):
+    """
+    Write one run of same-kind operations with executemany().
+    """
+    if op == 'add':
+        cursor.executemany(ADD_BOOK_SQL, [
+            (o['books_id'], o['name'], o['author_name'], o.get('category'), o.get('description'))
+            for o in operations])
+        # Static resources are only added when provided, like /books/add
+        cursor.executemany(ADD_STATIC_SQL, [
+            static_row(o) for o in operations if 'picture_url' in o or 'download_url' in o])
+    elif op == 'update':
+        cursor.executemany(UPDATE_BOOK_SQL, [
+            (o.get('name'), o.get('author_name'), o.get('category'), o.get('description'),
+             o['books_id'])
+            for o in operations])
+        cursor.executemany(UPDATE_STATIC_SQL, [
+            (o.get('picture_url'), o.get('download_url'), o['books_id'])
+            for o in operations if 'picture_url' in o or 'download_url' in o])
+    elif op == 'delete':
+        params = [(o['books_id'],) for o in operations]
+        cursor.executemany(DELETE_STATIC_SQL, params)
+        cursor.executemany(DELETE_BOOK_SQL, params)
+
+
+def apply_book_batch(operations):
+    """
+    Apply add, update and delete operations to books and books_static in a
+    single transaction. Each operation is a dict with 'op', 'books_id' and,
+    for add/update, the book and static resource fields.
+    Returns one result per operation, in order, with an HTTP-style status,
+    or None if the transaction failed and was rolled back.
+    """
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            # Take the write lock before checking ids so no writer can interleave
+            cursor.execute('BEGIN IMMEDIATE')
+            ids = [o['books_id'] for o in operations if validate_operation(o) is None]
+            results, runs = plan_batch(operations, existing_book_ids(cursor, ids))
+            for op, run in runs:
+                execute_run(cursor, op, run)
+            conn.commit()
+        except Exception as e:
+            print(f"Error applying batch: {e}")
+            conn.rollback()
+            return None
+
+    for op, run in runs:
+        for operation in run:
+            book_cache.evict(operation['books_id'])
+            static_cache.evict(operation['books_id'])
+    return results
+
+
+def validate_record(record):
+    """
+    Return an error message for a malformed imported book, or None.
+    """
+    if not isinstance(record, dict):
+        return "Record must be an object"
+    error = field_error(record)
+    if error:
+        return error
+    if not all(record.get(key) for key in ['name', 'author_name']):
+        return "Missing required fields"
+    return None
+
+
+def import_books_chunk(records, on_conflict='skip'):
+    """
+    Write one chunk of validated book records in a single transaction.
+    With on_conflict='skip' existing books are left untouched; with
+    'upsert' they are overwritten. Static resources are written for
+    records that carry picture_url or download_url.
+    Returns (created, updated, skipped), or None if the chunk failed and
+    was rolled back.
+    """
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            seen = existing_book_ids(cursor, [r['books_id'] for r in records])
+            created = updated = skipped = 0
+            rows = []
+            for record in records:
+                if record['books_id'] in seen:
+                    if on_conflict == 'skip':
+                        skipped += 1
+                        continue
+                    updated += 1
+                else:
+                    created += 1
+                    seen.add(record['books_id'])
+                rows.append(record)
+
+            cursor.executemany(UPSERT_BOOK_SQL, [
+                (r['books_id'], r['name'], r['author_name'], r.get('category'), r.get('description'))
+                for r in rows])
+            cursor.executemany(UPSERT_STATIC_SQL, [
+                static_row(r) for r in rows if 'picture_url' in r or 'download_url' in r])
+            conn.commit()
+        except Exception as e:
+            print(f"Error importing books: {e}")
+            conn.rollback()
+            return None
+
+    for record in rows:
+        book_cache.evict(record['books_id'])
+        static_cache.evict(record['books_id'])
+    return created, updated, skipped
+
+
+def import_ndjson(lines, chunk_size=IMPORT_CHUNK_SIZE, on_conflict='skip'):
+    """
+    Import books from an iterable of NDJSON lines (bytes or str), parsing
+    them one at a time and writing chunk_size records per transaction, so
+    memory use does not depend on the input size.
+    Returns a summary of the import.
+    """
+    if on_conflict not in IMPORT_POLICIES:
+        raise ValueError(f"Unsupported conflict policy: {on_conflict}")
+    summary = {"lines": 0, "created": 0, "updated": 0, "skipped": 0,
+               "invalid": 0, "failed": 0, "errors": []}
+
+    def report(line_number, message):
+        if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+            summary["errors"].append({"line": line_number, "message": message})
+
+    def flush(chunk):
+        counts = import_books_chunk([record for _, record in chunk], on_conflict)
+        if counts is None:
+            summary["failed"] += len(chunk)
+            report(chunk[0][0], f"Chunk of {len(chunk)} records failed and was rolled back")
+            return
+        summary["created"] += counts[0]
+        summary["updated"] += counts[1]
+        summary["skipped"] += counts[2]
+
+    chunk = []
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        summary["lines"] += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            summary["invalid"] += 1
+            report(line_number, "Invalid JSON")
+            continue
+        error = validate_record(record)
+        if error:
+            summary["invalid"] += 1
+            report(line_number, error)
+            continue
+
+        chunk.append((line_number, record))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    return summary
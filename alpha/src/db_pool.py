@@ -0,0 +1,209 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+# Maximum number of idle connections kept per database file
+POOL_SIZE = 5
+
+# Idle connections older than this (seconds) are pinged before reuse
+HEALTH_CHECK_INTERVAL = 30
+
+# PRAGMA profiles applied to every new connection. Schema-level pragmas
+# (journal_mode, synchronous, cache_size, mmap_size) are also applied to
+# attached databases; temp_store and busy_timeout are per connection.
+PRAGMA_PROFILES = {
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,  # ~16MB page cache
+        'mmap_size': 128 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,  # ms
+    },
+    'bulk-load': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -256000,  # ~256MB page cache
+        'mmap_size': 1024 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,  # ms
+    },
+}
+PRAGMA_PROFILE = 'default'
+SCHEMA_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size')
+
+# Databases ATTACHed to every new connection: {path: {alias: attached_path}}
+ATTACHED_DATABASES = {}
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def _get_pool(path):
+    """
+    Return the idle-connection queue for a database path.
+    Pools are dropped after a fork so workers never share a connection.
+    """
+    global _pools, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools = {}
+            _pools_pid = os.getpid()
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = queue.LifoQueue(maxsize=POOL_SIZE)
+        return pool
+
+
+def _connect(path):
+    """
+    Open a new connection that may be handed between threads.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    attached = ATTACHED_DATABASES.get(path, {})
+    for alias, attached_path in attached.items():
+        conn.execute(f'ATTACH DATABASE ? AS {alias}', (attached_path,))
+    apply_pragmas(conn, ['main', *attached])
+    return conn
+
+
+def apply_pragmas(conn, schemas=('main',), profile=None):
+    """
+    Apply a PRAGMA profile (the active one by default) to a connection.
+    """
+    pragmas = PRAGMA_PROFILES[profile or PRAGMA_PROFILE]
+    for name, value in pragmas.items():
+        if name in SCHEMA_PRAGMAS:
+            for schema in schemas:
+                conn.execute(f'PRAGMA {schema}.{name} = {value}').fetchall()
+        else:
+            conn.execute(f'PRAGMA {name} = {value}').fetchall()
+
+
+def set_pragma_profile(profile):
+    """
+    Switch the active PRAGMA profile, e.g. to 'bulk-load' for large imports.
+    Idle pooled connections are closed so new ones pick up the profile.
+    """
+    global PRAGMA_PROFILE
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown PRAGMA profile: {profile}")
+    if profile != PRAGMA_PROFILE:
+        PRAGMA_PROFILE = profile
+        close_all_connections()
+
+
+def attach_database(path, alias, attached_path):
+    """
+    Make `attached_path` available as schema `alias` on connections to `path`.
+    Must be registered before the first connection to `path` is opened.
+    """
+    ATTACHED_DATABASES.setdefault(path, {})[alias] = attached_path
+
+
+def _is_healthy(conn):
+    """
+    Check that a pooled connection is still usable.
+    """
+    try:
+        conn.execute('SELECT 1').fetchone()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _borrow(path):
+    """
+    Take an idle connection from the pool or open a new one.
+    """
+    pool = _get_pool(path)
+    while True:
+        try:
+            conn, last_used = pool.get_nowait()
+        except queue.Empty:
+            return _connect(path)
+        if time.monotonic() - last_used < HEALTH_CHECK_INTERVAL or _is_healthy(conn):
+            return conn
+        conn.close()
+
+
+def _release(path, conn):
+    """
+    Return a connection to the pool, closing it if the pool is full.
+    """
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _get_pool(path).put_nowait((conn, time.monotonic()))
+    except queue.Full:
+        conn.close()
+
+
+@contextmanager
+def get_connection(path):
+    """
+    Borrow a connection for the given database path.
+    Inside a Flask app context the connection is kept in `g` and shared by
+    every CRUD call of the request until teardown. Outside of one it is
+    returned to the pool as soon as the block exits.
+    """
+    if has_app_context():
+        connections = g.setdefault('db_connections', {})
+        conn = connections.get(path)
+        if conn is None:
+            conn = connections[path] = _borrow(path)
+        try:
+            yield conn
+        finally:
+            # Never leak a failed write into the next call of the request
+            if conn.in_transaction:
+                conn.rollback()
+        return
+
+    conn = _borrow(path)
+    try:
+        yield conn
+    finally:
+        _release(path, conn)
+
+
+def close_request_connections(exception=None):
+    """
+    Hand every connection borrowed by the current app context back to the pool.
+    """
+    connections = g.pop('db_connections', {})
+    for path, conn in connections.items():
+        _release(path, conn)
+
+
+def close_all_connections():
+    """
+    Close every idle pooled connection.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        while True:
+            try:
+                conn, _ = pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
+def init_db_pool(app):
+    """
+    Configure the pool from app.config and register request teardown.
+    """
+    global POOL_SIZE, HEALTH_CHECK_INTERVAL
+    POOL_SIZE = app.config.get('DB_POOL_SIZE', POOL_SIZE)
+    HEALTH_CHECK_INTERVAL = app.config.get(
+        'DB_HEALTH_CHECK_INTERVAL', HEALTH_CHECK_INTERVAL)
+    set_pragma_profile(app.config.get('DB_PRAGMA_PROFILE', PRAGMA_PROFILE))
+    app.teardown_appcontext(close_request_connections)
@@ -1,19 +1,322 @@
-from flask import request, jsonify
+import base64
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Response, current_app, make_response, request, jsonify, stream_with_context
 from crud_books_data import (
+    BOOK_FIELDS,
+    BOOK_FILTER_COLUMNS,
+    BOOK_SORT_COLUMNS,
+    BOOK_UPDATE_COLUMNS,
+    SQLITE_INT_MAX,
+    SQLITE_INT_MIN,
     add_book,
-    get_all_books,
+    book_cache,
+    book_page_index,
+    get_all_books_with_static,
+    get_book_changes,
+    get_books_by_ids,
+    get_books_page,
+    get_catalog_revision,
+    get_static_changes,
+    iter_all_books_with_static,
+    patch_book,
+    upsert_book,
+    search_books,
     get_book_by_id,
     update_book,
     delete_book
 )
+from crud_books_batch import (
+    IMPORT_CHUNK_SIZE,
+    IMPORT_POLICIES,
+    apply_book_batch,
+    import_ndjson
+)
+from compression import get_precompressed, precompressed_stats
+from encoders import encode_response
+from events import stream_events
 from crud_books_static import (
+    STATIC_UPDATE_COLUMNS,
     add_book_static,
     get_book_static,
+    patch_book_static,
     update_book_static,
     delete_book_static,
-    get_all_books_static
+    get_all_books_static,
+    iter_all_books_static,
+    static_cache
 )
 
+# Keyset pagination limits for GET /books
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Representations of each book in GET /books: JSON objects, or arrays
+# encoded straight from the row tuples (BOOK_FIELDS order unless ?fields=)
+BOOK_SHAPES = ('objects', 'rows')
+
+# Maximum number of ids accepted by GET /books?ids=
+MAX_MULTI_GET_IDS = 1000
+
+# Maximum number of operations accepted by POST /books/batch
+MAX_BATCH_OPERATIONS = 10000
+
+# Largest transaction size a client may request from POST /books/import
+MAX_IMPORT_CHUNK_SIZE = 50000
+
+# Formats served by GET /books/export and their columns
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_COLUMNS = ('books_id', 'name', 'author_name', 'category', 'description',
+                  'picture_url', 'download_url')
+
+# Request body limit for POST /books/import (64GB)
+IMPORT_MAX_CONTENT_LENGTH = 64 * 1024 * 1024 * 1024
+
+
+def book_row_to_dict(book):
+    """
+    Build the JSON representation of a books/books_static joined row.
+    """
+    return {
+        "books_id": book[0],
+        "name": book[1],
+        "author_name": book[2],
+        "category": book[3],
+        "description": book[4],
+        "static_resources": {
+            "picture_url": book[6],
+            "download_url": book[7]
+        } if book[5] else None
+    }
+
+
+def parse_fields():
+    """
+    Parse ?fields=books_id,name,... into a list of BOOK_FIELDS names, or
+    None when the full representation was requested.
+    Raises ValueError for unknown fields.
+    """
+    value = request.args.get('fields')
+    if value is None:
+        return None
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in BOOK_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"fields must be a comma-separated list of {', '.join(BOOK_FIELDS)}")
+    return fields
+
+
+def select_fields(fields, *required):
+    """
+    Columns to select for a projection: the requested fields followed by
+    any the route needs itself (ids, cursor values). Those extra columns
+    are left out of the response by book_row_converter().
+    """
+    if fields is None:
+        return None
+    return fields + [field for field in required if field not in fields]
+
+
+def column_index(columns, field):
+    """
+    Position of a field in rows selected with `columns`. The full row
+    (columns=None) starts with the same book columns as BOOK_FIELDS.
+    """
+    return (columns or list(BOOK_FIELDS)).index(field)
+
+
+def book_row_converter(fields, shape='objects'):
+    """
+    Return the function building the representation of rows selected for
+    `fields`. Objects are book_row_to_dict() for full rows, otherwise a
+    flat object holding only the requested fields. Rows are the tuples
+    themselves, trimmed to the BOOK_FIELDS or requested columns.
+    """
+    if shape == 'rows':
+        if fields is None:
+            # Drop the has_static flag
+            return lambda book: book[:5] + book[6:]
+        width = len(fields)
+        return lambda book: book[:width]
+    if fields is None:
+        return book_row_to_dict
+    return lambda book: dict(zip(fields, book))
+
+
+def static_row_to_dict(data):
+    """
+    Build the JSON representation of a books_static row.
+    """
+    return {
+        "books_id": data[0],
+        "picture_url": data[1],
+        "download_url": data[2]
+    }
+
+
+def wants_stream():
+    """
+    Whether the client asked for a streamed response with ?stream=1.
+    """
+    return request.args.get('stream', '').lower() in ('1', 'true')
+
+
+def stream_json_array(batches, to_dict):
+    """
+    Stream batches of rows as one JSON array, one chunk per batch.
+    """
+    def generate():
+        dumps = current_app.json.dumps
+        yield '['
+        separator = ''
+        for rows in batches:
+            yield separator + ','.join(dumps(to_dict(row)) for row in rows)
+            separator = ','
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def catalog_conditional(f):
+    """
+    Conditional GET decorator: answers If-None-Match / If-Modified-Since
+    with 304 from the catalog revision alone, before any row is read, and
+    tags 200 responses with an ETag and Last-Modified. Compressed bodies
+    cached for the current revision are served without calling the view.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        books_revision, static_revision, updated_at = get_catalog_revision()
+        etag = f"{books_revision}.{static_revision}"
+        last_modified = datetime.fromtimestamp(updated_at, timezone.utc)
+
+        if request.if_none_match:
+            # Weak comparison: compressed responses carry a weak ETag
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            since = request.if_modified_since
+            not_modified = since is not None and last_modified <= since
+
+        if not_modified:
+            response = Response(status=304)
+        else:
+            response = get_precompressed(etag) or make_response(f(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(etag, weak='Content-Encoding' in response.headers)
+            response.last_modified = last_modified
+        return response
+    return decorated_function
+
+
+def parse_revision(value):
+    """
+    Parse a "<books revision>.<static revision>" token, as sent in ETags
+    and next_since, raising ValueError if it is malformed.
+    """
+    try:
+        books_revision, static_revision = map(int, value.removeprefix('W/').strip('"').split('.'))
+    except ValueError:
+        raise ValueError("revision must look like <books>.<static>")
+    if not (0 <= books_revision <= SQLITE_INT_MAX and 0 <= static_revision <= SQLITE_INT_MAX):
+        raise ValueError("revision is out of range")
+    return books_revision, static_revision
+
+
+def change_row_to_dict(change):
+    """
+    Build the JSON representation of a change feed row.
+    """
+    if change[1]:
+        return {"books_id": change[2], "deleted": True}
+    book_dict = book_row_to_dict(change[2:])
+    book_dict["deleted"] = False
+    return book_dict
+
+
+def export_rows(batches, export_format):
+    """
+    Serialize batches of joined book rows as NDJSON lines or CSV, one text
+    chunk per batch. Both use the flat EXPORT_COLUMNS layout; NDJSON
+    exports can be fed back to POST /books/import.
+    """
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+        for rows in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                (book[0], book[1], book[2], book[3], book[4], book[6], book[7]) for book in rows)
+            yield buffer.getvalue()
+    else:
+        for rows in batches:
+            lines = []
+            for book in rows:
+                record = dict(zip(EXPORT_COLUMNS[:5], book[:5]))
+                # Static columns only for books that have them, so a
+                # re-import does not create default static resources
+                if book[5]:
+                    record["picture_url"] = book[6]
+                    record["download_url"] = book[7]
+                lines.append(json.dumps(record) + '\n')
+            yield ''.join(lines)
+
+
+def gzip_chunks(chunks):
+    """
+    Gzip a stream of text chunks on the fly.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Parse a page size query parameter, raising ValueError when out of range.
+    """
+    limit = default if value is None else int(value)
+    if not 1 <= limit <= maximum:
+        raise ValueError(f"limit must be between 1 and {maximum}")
+    return limit
+
+
+def encode_cursor(sort, value, books_id):
+    """
+    Encode the position of a row as an opaque cursor for the given sort.
+    """
+    payload = json.dumps([sort, value, books_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    """
+    Decode a cursor into the (sort value, books_id) pair it points after.
+    Raises ValueError if the cursor is malformed or from another sort.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, books_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise ValueError("Malformed cursor")
+    # Only values SQLite can bind may reach the query
+    if (not isinstance(value, (str, int, float, type(None)))
+            or not isinstance(books_id, int)
+            or not SQLITE_INT_MIN <= books_id <= SQLITE_INT_MAX
+            or (isinstance(value, int) and not SQLITE_INT_MIN <= value <= SQLITE_INT_MAX)):
+        raise ValueError("Malformed cursor")
+    if cursor_sort != sort:
+        raise ValueError("Cursor does not match sort order")
+    return value, books_id
+
 
 def setup_routes(app):
     @app.route('/')
@@ -44,28 +347,222 @@ def setup_routes(app):
             return jsonify({"message": "Book added successfully"}), 201
         return jsonify({"message": "Failed to add book"}), 400
 
+    @app.route('/books/batch', methods=['POST'])
+    def batch_books_route():
+        operations = request.json
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"message": "Expected a non-empty array of operations"}), 400
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({"message": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+
+        results = apply_book_batch(operations)
+        if results is None:
+            return jsonify({"message": "Failed to apply batch"}), 400
+        return jsonify({"results": results}), 200
+
+    @app.route('/books/import', methods=['POST'])
+    def import_books_route():
+        on_conflict = request.args.get('on_conflict', 'skip')
+        if on_conflict not in IMPORT_POLICIES:
+            return jsonify({"message": f"on_conflict must be one of {', '.join(IMPORT_POLICIES)}"}), 400
+        try:
+            chunk_size = parse_limit(request.args.get('chunk_size'),
+                                     default=IMPORT_CHUNK_SIZE, maximum=MAX_IMPORT_CHUNK_SIZE)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        # Catalog dumps are read line by line, so they get their own,
+        # much larger, size limit instead of the upload one
+        request.max_content_length = current_app.config.get(
+            'IMPORT_MAX_CONTENT_LENGTH', IMPORT_MAX_CONTENT_LENGTH)
+        # request.stream is unbuffered; buffer it so lines are not read byte by byte
+        lines = io.BufferedReader(request.stream, buffer_size=64 * 1024)
+        summary = import_ndjson(lines, chunk_size, on_conflict)
+        return jsonify(summary), 200
+
+    @app.route('/books/export', methods=['GET'])
+    @catalog_conditional
+    def export_books_route():
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"message": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+        chunks = export_rows(iter_all_books_with_static(), export_format)
+        headers = {'Content-Disposition': f'attachment; filename=books.{export_format}'}
+        if request.accept_encodings.best_match(['gzip']):
+            chunks = gzip_chunks(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+        return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format],
+                        headers=headers)
+
     @app.route('/books', methods=['GET'])
+    @catalog_conditional
     def get_all_books_route():
-        books = get_all_books()
-        books_list = []
-        for book in books:
-            static_data = get_book_static(book[0])  # book[0] is books_id
-            book_dict = {
-                "books_id": book[0],
-                "name": book[1],
-                "author_name": book[2],
-                "category": book[3],
-                "description": book[4],
-                "static_resources": {
-                    "picture_url": static_data[1] if static_data else None,
-                    "download_url": static_data[2] if static_data else None
-                } if static_data else None
-            }
-            books_list.append(book_dict)
-        return jsonify(books_list), 200
+        # Sparse fieldsets: ?fields= is pushed down into the SELECT list
+        try:
+            fields = parse_fields()
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        shape = request.args.get('shape', 'objects')
+        if shape not in BOOK_SHAPES:
+            return jsonify({"message": f"shape must be one of {', '.join(BOOK_SHAPES)}"}), 400
+        to_dict = book_row_converter(fields, shape)
+
+        if 'ids' in request.args:
+            # Multi-get: results follow the request order, misses are null
+            try:
+                ids = [int(books_id) for books_id in request.args['ids'].split(',')]
+                if not all(SQLITE_INT_MIN <= books_id <= SQLITE_INT_MAX for books_id in ids):
+                    raise ValueError
+            except ValueError:
+                return jsonify({"message": "ids must be a comma-separated list of integers"}), 400
+            if len(ids) > MAX_MULTI_GET_IDS:
+                return jsonify({"message": f"At most {MAX_MULTI_GET_IDS} ids per request"}), 400
+
+            columns = select_fields(fields, 'books_id')
+            id_index = column_index(columns, 'books_id')
+            found = {book[id_index]: book for book in get_books_by_ids(ids, columns)}
+            return encode_response({
+                "books": [to_dict(found[books_id]) if books_id in found else None
+                          for books_id in ids],
+                "missing": [books_id for books_id in dict.fromkeys(ids) if books_id not in found]
+            })
+
+        if wants_stream():
+            return stream_json_array(iter_all_books_with_static(fields=fields), to_dict)
+
+        if not any(key in request.args for key in ['limit', 'after', 'sort', *BOOK_FILTER_COLUMNS]):
+            books_list = [to_dict(book) for book in get_all_books_with_static(fields)]
+            return encode_response(books_list)
+
+        # Keyset pagination: ?limit=&after=<cursor>&sort=, optionally
+        # filtered by exact or 'prefix*' values of ?category=&author_name=
+        filters = {column: request.args[column]
+                   for column in BOOK_FILTER_COLUMNS if column in request.args}
+        sort = request.args.get('sort', 'books_id')
+        if sort not in BOOK_SORT_COLUMNS:
+            return jsonify({"message": "Invalid sort field"}), 400
+        if book_page_index(sort, filters) is None:
+            return jsonify({"message": f"These filters cannot be paged with sort={sort}; "
+                                       "a 'prefix*' filter needs sort on the same column"}), 400
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            after = request.args.get('after')
+            if after is not None:
+                after = decode_cursor(sort, after)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        # Fetch one extra row to know whether another page exists
+        columns = select_fields(fields, sort, 'books_id')
+        books = get_books_page(sort, after, limit + 1, filters, columns)
+        next_cursor = None
+        if len(books) > limit:
+            last = books[limit - 1]
+            next_cursor = encode_cursor(sort, last[column_index(columns, sort)],
+                                        last[column_index(columns, 'books_id')])
+        return encode_response({
+            "books": [to_dict(book) for book in books[:limit]],
+            "next_cursor": next_cursor
+        })
+
+    @app.route('/books/search', methods=['GET'])
+    def search_books_route():
+        text = request.args.get('q', '').strip()
+        if not text:
+            return jsonify({"message": "Missing search query"}), 400
+        try:
+            fields = parse_fields()
+            limit = parse_limit(request.args.get('limit'), default=20)
+            after = request.args.get('after')
+            if after is not None:
+                after = decode_cursor('rank', after)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+
+        # Rows end with the snippet and the BM25 score
+        columns = select_fields(fields, 'books_id')
+        books = search_books(text, after, limit + 1, columns)
+        to_dict = book_row_converter(fields)
+        results = []
+        for book in books[:limit]:
+            book_dict = to_dict(book)
+            book_dict["snippet"] = book[-2]
+            book_dict["score"] = book[-1]
+            results.append(book_dict)
+        next_cursor = None
+        if len(books) > limit:
+            last = books[limit - 1]
+            next_cursor = encode_cursor('rank', last[-1], last[column_index(columns, 'books_id')])
+        return encode_response({"books": results, "next_cursor": next_cursor})
+
+    @app.route('/books/cache', methods=['GET'])
+    def cache_stats_route():
+        return jsonify({
+            "books": book_cache.stats(),
+            "books_static": static_cache.stats(),
+            "precompressed": precompressed_stats()
+        }), 200
+
+    @app.route('/books/changes', methods=['GET'])
+    def get_book_changes_route():
+        try:
+            books_since, static_since = parse_revision(request.args.get('since', '0.0'))
+            limit = parse_limit(request.args.get('limit'), default=100)
+        except ValueError as e:
+            return jsonify({"message": f"Invalid parameters: {e}"}), 400
+
+        # Drain book changes first, then fill the page with static changes
+        book_changes = get_book_changes(books_since, limit + 1)
+        has_more = len(book_changes) > limit
+        book_changes = book_changes[:limit]
+        if book_changes:
+            books_since = book_changes[-1][0]
+
+        static_changes = []
+        if not has_more:
+            remaining = limit - len(book_changes)
+            static_changes = get_static_changes(static_since, remaining + 1)
+            has_more = len(static_changes) > remaining
+            static_changes = static_changes[:remaining]
+            if static_changes:
+                static_since = static_changes[-1][0]
+
+        return encode_response({
+            "changes": [change_row_to_dict(change) for change in book_changes + static_changes],
+            "next_since": f"{books_since}.{static_since}",
+            "has_more": has_more
+        })
+
+    @app.route('/books/events', methods=['GET'])
+    def book_events_route():
+        # EventSource sends Last-Event-ID when it reconnects
+        last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+        try:
+            since = parse_revision(last_event_id) if last_event_id else None
+        except ValueError:
+            return jsonify({"message": "Invalid Last-Event-ID"}), 400
+        return Response(
+            stream_events(change_row_to_dict, since),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
 
     @app.route('/books/<int:books_id>', methods=['GET'])
+    @catalog_conditional
     def get_book_by_id_route(books_id):
+        try:
+            fields = parse_fields()
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        if fields is not None:
+            # Projected reads go straight to SQL rather than the row caches
+            books = get_books_by_ids([books_id], fields)
+            if not books:
+                return jsonify({"message": "Book not found"}), 404
+            return encode_response(book_row_converter(fields)(books[0]))
+
         book = get_book_by_id(books_id)
         if not book:
             return jsonify({"message": "Book not found"}), 404
@@ -82,7 +579,7 @@ def setup_routes(app):
                 "download_url": static_data[2] if static_data else None
             } if static_data else None
         }
-        return jsonify(book_dict), 200
+        return encode_response(book_dict)
 
     @app.route('/books/update/<int:books_id>', methods=['PUT'])
     def update_book_route(books_id):
@@ -95,6 +592,9 @@ def setup_routes(app):
             data.get('description')
         )
 
+        if book_updated is False:
+            return jsonify({"message": "Book not found"}), 404
+
         # Handle static resource updates if provided
         static_updated = True
         if 'picture_url' in data or 'download_url' in data:
@@ -104,10 +604,66 @@ def setup_routes(app):
                 data.get('download_url')
             )
 
-        if book_updated and static_updated:
+        # A book without static resources is not an error here
+        if book_updated and static_updated is not None:
             return jsonify({"message": "Book updated successfully"}), 200
         return jsonify({"message": "Failed to update book"}), 400
 
+    @app.route('/books/<int:books_id>', methods=['PUT'])
+    def upsert_book_route(books_id):
+        data = request.json
+        if not isinstance(data, dict) or not all(data.get(key) for key in ['name', 'author_name']):
+            return jsonify({"message": "Missing required fields"}), 400
+        if data.get('books_id', books_id) != books_id:
+            return jsonify({"message": "books_id does not match the URL"}), 400
+
+        # Full replacement of the book; static resources only if provided
+        status = upsert_book(
+            books_id,
+            data['name'],
+            data['author_name'],
+            data.get('category'),
+            data.get('description'),
+            data.get('picture_url'),
+            data.get('download_url'),
+            with_static='picture_url' in data or 'download_url' in data
+        )
+        if status is None:
+            return jsonify({"message": "Failed to save book"}), 400
+        if status == 'created':
+            return jsonify({"message": "Book created successfully", "status": status}), 201
+        if status == 'updated':
+            return jsonify({"message": "Book updated successfully", "status": status}), 200
+        return jsonify({"message": "Book unchanged", "status": status}), 200
+
+    @app.route('/books/<int:books_id>', methods=['PATCH'])
+    def patch_book_route(books_id):
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({"message": "Expected a JSON object"}), 400
+        unknown = set(data) - set(BOOK_UPDATE_COLUMNS) - set(STATIC_UPDATE_COLUMNS)
+        if unknown:
+            return jsonify({"message": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+        if not data:
+            return jsonify({"message": "No fields to update"}), 400
+
+        # Only the fields present in the body are written, nulls included
+        book_updated = patch_book(
+            books_id, {key: data[key] for key in BOOK_UPDATE_COLUMNS if key in data})
+        if book_updated is None:
+            return jsonify({"message": "Failed to update book"}), 400
+        if not book_updated:
+            return jsonify({"message": "Book not found"}), 404
+
+        static_fields = {key: data[key] for key in STATIC_UPDATE_COLUMNS if key in data}
+        if static_fields:
+            # A book without static resources gets a row holding exactly
+            # these fields; the ones not sent stay NULL, not default URLs
+            static_updated = patch_book_static(books_id, static_fields, create=True)
+            if not static_updated:
+                return jsonify({"message": "Failed to update static resources"}), 400
+        return jsonify({"message": "Book updated successfully"}), 200
+
     @app.route('/books/delete/<int:books_id>', methods=['DELETE'])
     def delete_book_route(books_id):
         # Delete static resources first (if they exist)
@@ -119,19 +675,17 @@ def setup_routes(app):
 
     # Static resources specific routes
     @app.route('/books/static', methods=['GET'])
+    @catalog_conditional
     def get_all_books_static_route():
+        if wants_stream():
+            return stream_json_array(iter_all_books_static(), static_row_to_dict)
+
         static_data = get_all_books_static()
         if not static_data:
             return jsonify([]), 200
-        
-        result = []
-        for data in static_data:
-            result.append({
-                "books_id": data[0],
-                "picture_url": data[1],
-                "download_url": data[2]
-            })
-        return jsonify(result), 200
+
+        result = [static_row_to_dict(data) for data in static_data]
+        return encode_response(result)
 
     @app.route('/books/static/add/<int:books_id>', methods=['POST'])
     def add_book_static_route(books_id):
@@ -144,18 +698,22 @@ def setup_routes(app):
     def get_book_static_route(books_id):
         static_data = get_book_static(books_id)
         if static_data:
-            return jsonify({
+            return encode_response({
                 "books_id": static_data[0],
                 "picture_url": static_data[1],
                 "download_url": static_data[2]
-            }), 200
+            })
         return jsonify({"message": "Static resources not found"}), 404
 
     @app.route('/books/static/update/<int:books_id>', methods=['PUT'])
     def update_book_static_route(books_id):
         data = request.json
-        if update_book_static(books_id, data.get('picture_url'), data.get('download_url')):
+        static_updated = update_book_static(
+            books_id, data.get('picture_url'), data.get('download_url'))
+        if static_updated:
             return jsonify({"message": "Static resources updated successfully"}), 200
+        if static_updated is False:
+            return jsonify({"message": "Static resources not found"}), 404
         return jsonify({"message": "Failed to update static resources"}), 400
 
     @app.route('/books/static/delete/<int:books_id>', methods=['DELETE'])
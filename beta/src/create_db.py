@@ -1,38 +1,165 @@
-import sqlite3
-from crud_books_data import DATABASE_BOOKS_PATH
+from db_pool import get_connection, set_pragma_profile
+from crud_books_data import BOOK_INDEXES, DATABASE_BOOKS_PATH
 from crud_books_static import DATABASE_STATIC_PATH
 
 
-def initialize_databases():
+def initialize_databases(profile=None):
     """
-    Initialize both books and books_static databases with their tables
+    Initialize both books and books_static databases with their tables.
+    The PRAGMA profile (WAL journaling etc.) is applied to every connection
+    opened from here on, which also persists journal_mode=WAL in both files.
     """
+    if profile:
+        set_pragma_profile(profile)
+
     # Initialize books database
-    conn = sqlite3.connect(DATABASE_BOOKS_PATH)
-    cursor = conn.cursor()
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                books_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                author_name TEXT NOT NULL,
+                category TEXT,
+                description TEXT
+            )
+        ''')
+        # Keyset pagination and filter indexes for GET /books?sort=&category=
+        # &author_name=. books_id is the rowid, so each index already covers
+        # the (columns..., books_id) seek and order.
+        for key in BOOK_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS idx_books_{"_".join(key)} '
+                f'ON books ({", ".join(key)})')
+        create_search_index(cursor)
+        create_revision_tracking(cursor, 'books')
+        conn.commit()
+
+    # Initialize books_static database
+    with get_connection(DATABASE_STATIC_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS books_static (
+                books_id INTEGER PRIMARY KEY,
+                picture_url TEXT,
+                download_url TEXT,
+                FOREIGN KEY (books_id) REFERENCES books (books_id)
+                ON DELETE CASCADE
+            )
+        ''')
+        create_revision_tracking(cursor, 'books_static')
+        conn.commit()
+
+
+def create_search_index(cursor):
+    """
+    Create the books_fts full-text index and the triggers keeping it in
+    sync with the books table. The index is built from existing rows the
+    first time it is created.
+    """
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'")
+    exists = cursor.fetchone() is not None
+
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            books_id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            author_name TEXT NOT NULL,
-            category TEXT,
-            description TEXT
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            name, author_name, category, description,
+            content='books', content_rowid='books_id',
+            tokenize='unicode61 remove_diacritics 2'
         )
     ''')
-    conn.commit()
-    conn.close()
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, name, author_name, category, description)
+            VALUES (new.books_id, new.name, new.author_name, new.category, new.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, name, author_name, category, description)
+            VALUES ('delete', old.books_id, old.name, old.author_name, old.category, old.description);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, name, author_name, category, description)
+            VALUES ('delete', old.books_id, old.name, old.author_name, old.category, old.description);
+            INSERT INTO books_fts (rowid, name, author_name, category, description)
+            VALUES (new.books_id, new.name, new.author_name, new.category, new.description);
+        END
+    ''')
+    if not exists:
+        cursor.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
 
-    # Initialize books_static database
-    conn = sqlite3.connect(DATABASE_STATIC_PATH)
-    cursor = conn.cursor()
+
+def create_revision_tracking(cursor, table):
+    """
+    Create the single-row catalog_revision table of a database, the
+    `<table>_changes` feed holding the revision of each row's latest change
+    (deleted rows are kept as tombstones), and the triggers maintaining
+    both on every insert, update or delete on `table`.
+    The revision drives ETag/Last-Modified headers and GET /books/changes.
+    """
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS books_static (
+        CREATE TABLE IF NOT EXISTS catalog_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO catalog_revision (id, revision, updated_at)
+        VALUES (1, 0, CAST(strftime('%s', 'now') AS INTEGER))
+    ''')
+
+    cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (f'{table}_changes',))
+    exists = cursor.fetchone() is not None
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table}_changes (
             books_id INTEGER PRIMARY KEY,
-            picture_url TEXT,
-            download_url TEXT,
-            FOREIGN KEY (books_id) REFERENCES books (books_id)
-            ON DELETE CASCADE
+            revision INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            created_revision INTEGER
         )
     ''')
-    conn.commit()
-    conn.close()
+    # Feeds created before created_revision existed; their rows count as updates
+    cursor.execute(f'PRAGMA table_info({table}_changes)')
+    if 'created_revision' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table}_changes ADD COLUMN created_revision INTEGER')
+    cursor.execute(
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_changes_revision '
+        f'ON {table}_changes (revision)')
+    if not exists:
+        # Seed the feed at a fresh revision so that since=0 covers rows
+        # written before it existed
+        cursor.execute(
+            'UPDATE catalog_revision SET revision = revision + 1 WHERE id = 1')
+        cursor.execute(f'''
+            INSERT INTO {table}_changes (books_id, revision, deleted, created_revision)
+            SELECT books_id, revision, 0, revision
+            FROM {table}, (SELECT revision FROM catalog_revision WHERE id = 1)
+        ''')
+
+    # Triggers are recreated on every start so their bodies stay current.
+    # created_revision is the revision of the row's latest INSERT, which
+    # lets readers tell an add from an update of the same feed row.
+    revision = '(SELECT revision FROM catalog_revision WHERE id = 1)'
+    for event, row, deleted, created in (('INSERT', 'new', 0, revision), ('UPDATE', 'new', 0, 'NULL'),
+                                         ('DELETE', 'old', 1, 'NULL')):
+        trigger = f'{table}_revision_{event.lower()}'
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute(f'''
+            CREATE TRIGGER {trigger} AFTER {event} ON {table} BEGIN
+                UPDATE catalog_revision
+                SET revision = revision + 1,
+                    updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE id = 1;
+                INSERT INTO {table}_changes (books_id, revision, deleted, created_revision)
+                VALUES ({row}.books_id, {revision}, {deleted}, {created})
+                ON CONFLICT (books_id) DO UPDATE
+                SET revision = excluded.revision, deleted = excluded.deleted,
+                    created_revision = COALESCE(excluded.created_revision, created_revision);
+            END
+        ''')
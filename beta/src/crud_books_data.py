@@ -1,93 +1,492 @@
 import sqlite3
+from book_cache import ReadThroughCache
+from db_pool import attach_database, get_connection
+from crud_books_static import DATABASE_STATIC_PATH, DEFAULT_DOWNLOAD_URL, DEFAULT_PICTURE_URL, static_cache
 
 # Path to the books database
 DATABASE_BOOKS_PATH = 'database/books_data.db'
 
+# books_static is attached to every books connection so both can be joined
+STATIC_SCHEMA = 'books_static_db'
+attach_database(DATABASE_BOOKS_PATH, STATIC_SCHEMA, DATABASE_STATIC_PATH)
+
+# Read-through cache in front of get_book_by_id()
+book_cache = ReadThroughCache(DATABASE_BOOKS_PATH, 'books_changes')
+
+# Rows fetched per fetchmany() call when streaming the catalog
+STREAM_BATCH_SIZE = 500
+
+# Id lists longer than this are joined through a temp table instead of IN (...)
+IN_LIST_MAX_IDS = 500
+
+# Range of the 64-bit integers SQLite can bind
+SQLITE_INT_MIN = -2 ** 63
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+# Columns GET /books can be sorted by; each is backed by an index
+BOOK_SORT_COLUMNS = ('books_id', 'name', 'author_name')
+
+# Columns GET /books can be filtered by; each is backed by an index
+BOOK_FILTER_COLUMNS = ('category', 'author_name')
+
+# Indexes on books, created by initialize_databases(). books_id is the
+# rowid and trails every key, so keyset pages of a filter are read in
+# order from the index whose columns are the exactly matched filters
+# followed by the sort column (see book_page_index())
+BOOK_INDEXES = (
+    ('name',),
+    ('author_name',),
+    ('category',),
+    ('category', 'name'),
+    ('category', 'author_name'),
+    ('author_name', 'name')
+)
+
+# Columns patch_book() may set
+BOOK_UPDATE_COLUMNS = ('name', 'author_name', 'category', 'description')
+
+# Insert-or-overwrite statements; rows whose values are unchanged are not
+# rewritten, so re-syncing an unchanged catalog writes nothing
+UPSERT_BOOK_SQL = '''
+    INSERT INTO books (books_id, name, author_name, category, description)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (books_id) DO UPDATE
+    SET name = excluded.name,
+        author_name = excluded.author_name,
+        category = excluded.category,
+        description = excluded.description
+    WHERE (name, author_name, category, description)
+          IS NOT (excluded.name, excluded.author_name, excluded.category, excluded.description)
+'''
+UPSERT_STATIC_SQL = f'''
+    INSERT INTO {STATIC_SCHEMA}.books_static (books_id, picture_url, download_url)
+    VALUES (?, ?, ?)
+    ON CONFLICT (books_id) DO UPDATE
+    SET picture_url = excluded.picture_url,
+        download_url = excluded.download_url
+    WHERE (picture_url, download_url) IS NOT (excluded.picture_url, excluded.download_url)
+'''
+
+# books LEFT JOIN books_static, yielding (books_id, name, author_name,
+# category, description, has_static, picture_url, download_url) rows
+BOOKS_WITH_STATIC_COLUMNS = ('b.books_id, b.name, b.author_name, b.category, b.description, '
+                             's.books_id IS NOT NULL, s.picture_url, s.download_url')
+STATIC_JOIN = f'LEFT JOIN {STATIC_SCHEMA}.books_static s ON s.books_id = b.books_id'
+BOOKS_WITH_STATIC_QUERY = f'''
+    SELECT {BOOKS_WITH_STATIC_COLUMNS}
+    FROM books b
+    {STATIC_JOIN}
+'''
+
+# Fields a client may project with ?fields=, and the column each selects
+BOOK_FIELDS = {
+    'books_id': 'b.books_id',
+    'name': 'b.name',
+    'author_name': 'b.author_name',
+    'category': 'b.category',
+    'description': 'b.description',
+    'picture_url': 's.picture_url',
+    'download_url': 's.download_url'
+}
+
 
 def add_book(name, author_name, books_id, category, description):
     """
     Add a new book to the 'books' table.
     """
-    conn = sqlite3.connect(DATABASE_BOOKS_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            INSERT INTO books (books_id, name, author_name, category, description)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (books_id, name, author_name, category, description))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        print("Error: Book ID already exists.")
-        return False
-    finally:
-        conn.close()
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO books (books_id, name, author_name, category, description)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (books_id, name, author_name, category, description))
+            conn.commit()
+            book_cache.evict(books_id)
+            return True
+        except sqlite3.IntegrityError:
+            print("Error: Book ID already exists.")
+            return False
 
 
 def get_all_books():
     """
     Retrieve all books from the 'books' table.
     """
-    conn = sqlite3.connect(DATABASE_BOOKS_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM books')
-    books = cursor.fetchall()
-    conn.close()
-    return books
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM books')
+        return cursor.fetchall()
+
+
+def books_select(fields=None, source='books b', extra=()):
+    """
+    Build the SELECT ... FROM part of a books/books_static query. With
+    fields=None rows have the BOOKS_WITH_STATIC_QUERY shape; otherwise only
+    the named BOOK_FIELDS are selected, in order, and books_static is only
+    joined when one of its columns is requested. `extra` columns are
+    appended after the fields.
+    """
+    if fields is None:
+        columns = [BOOKS_WITH_STATIC_COLUMNS]
+        join = True
+    else:
+        unknown = [field for field in fields if field not in BOOK_FIELDS]
+        if unknown or not fields:
+            raise ValueError(f"Unsupported fields: {', '.join(unknown)}")
+        columns = [BOOK_FIELDS[field] for field in fields]
+        join = any(column.startswith('s.') for column in columns)
+    query = f"SELECT {', '.join([*columns, *extra])} FROM {source}"
+    if join:
+        query += ' ' + STATIC_JOIN
+    return query
+
+
+def get_all_books_with_static(fields=None):
+    """
+    Retrieve all books joined with their static resources in one query.
+    Each row is (books_id, name, author_name, category, description,
+    has_static, picture_url, download_url), or only `fields` when given.
+    """
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        # Keep id order even when a projection is served from a covering index
+        cursor.execute(books_select(fields) + ' ORDER BY b.books_id')
+        return cursor.fetchall()
+
+
+def iter_all_books_with_static(batch_size=STREAM_BATCH_SIZE, fields=None):
+    """
+    Yield all books joined with their static resources in batches of rows,
+    so the catalog is never fully materialized in memory.
+    """
+    query = books_select(fields) + ' ORDER BY b.books_id'
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def get_books_by_ids(ids, fields=None):
+    """
+    Retrieve several books joined with their static resources in one query.
+    Small id sets use WHERE books_id IN (...); larger ones are loaded into
+    a temp table and joined. Rows come back in no particular order and
+    missing ids are simply absent. `fields` projects rows as in books_select().
+    """
+    query = books_select(fields)
+    ids = list(dict.fromkeys(ids))
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        if len(ids) <= IN_LIST_MAX_IDS:
+            placeholders = ','.join('?' * len(ids))
+            cursor.execute(query + f' WHERE b.books_id IN ({placeholders})', ids)
+            return cursor.fetchall()
+
+        cursor.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS requested_ids (books_id INTEGER PRIMARY KEY)')
+        cursor.execute('DELETE FROM requested_ids')
+        cursor.executemany('INSERT INTO requested_ids (books_id) VALUES (?)',
+                           [(books_id,) for books_id in ids])
+        cursor.execute(query + ' WHERE b.books_id IN (SELECT books_id FROM requested_ids)')
+        books = cursor.fetchall()
+        cursor.execute('DELETE FROM requested_ids')
+        conn.commit()
+        return books
+
+
+def book_filter_clauses(filters):
+    """
+    Build WHERE clauses and parameters for exact or prefix attribute filters.
+    A value ending in '*' matches as a prefix, expressed as an index range.
+    """
+    clauses = []
+    params = []
+    for column, value in filters.items():
+        if column not in BOOK_FILTER_COLUMNS:
+            raise ValueError(f"Unsupported filter column: {column}")
+        if value.endswith('*'):
+            prefix = value[:-1]
+            clauses.append(f'b.{column} >= ? AND b.{column} < ?')
+            params.extend([prefix, prefix + '\U0010ffff'])
+        else:
+            clauses.append(f'b.{column} = ?')
+            params.append(value)
+    return clauses, params
+
+
+def book_page_index(sort, filters):
+    """
+    Return the BOOK_INDEXES key that serves a filtered page in sort order
+    without sorting, or None. Exact filters may come in any order; a
+    prefix filter is a range, so it keeps index order only on the sort
+    column itself.
+    """
+    exact = {column for column, value in filters.items() if not value.endswith('*')}
+    prefix = [column for column, value in filters.items() if value.endswith('*')]
+    if prefix and prefix != [sort]:
+        return None
+    if sort == 'books_id' and not exact:
+        return ()
+    for key in BOOK_INDEXES:
+        if sort == 'books_id' or sort in exact:
+            if set(key) == exact:
+                return key
+        elif set(key[:-1]) == exact and key[-1] == sort and len(key) == len(exact) + 1:
+            return key
+    return None
+
+
+def get_books_page(sort='books_id', after=None, limit=50, filters=None, fields=None):
+    """
+    Retrieve one keyset page of books joined with their static resources.
+    `after` is the (sort value, books_id) pair of the last row of the
+    previous page, or None for the first page. `filters` maps columns in
+    BOOK_FILTER_COLUMNS to exact values or 'prefix*' patterns. Rows have
+    the same shape as get_all_books_with_static(fields).
+    """
+    if sort not in BOOK_SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort column: {sort}")
+    clauses, params = book_filter_clauses(filters or {})
+    if book_page_index(sort, filters or {}) is None:
+        # Every page would read and sort all matching books
+        raise ValueError(f"These filters cannot be paged with sort={sort}; "
+                         "a 'prefix*' filter needs sort on the same column")
+    if after is not None:
+        exact = (filters or {}).get(sort)
+        if sort == 'books_id' or (exact is not None and not exact.endswith('*')):
+            # With the sort value pinned by a filter, pages follow books_id
+            clauses.append('b.books_id > ?')
+            params.append(after[1])
+        else:
+            clauses.append(f'(b.{sort}, b.books_id) > (?, ?)')
+            params.extend(after)
+
+    query = books_select(fields)
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    if sort == 'books_id':
+        query += ' ORDER BY b.books_id'
+    else:
+        query += f' ORDER BY b.{sort}, b.books_id'
+    query += ' LIMIT ?'
+    params.append(limit)
+
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def fts_match_expression(text):
+    """
+    Turn free text into an FTS5 MATCH expression: every word must match,
+    the last one as a prefix. Words are quoted so FTS5 operators in user
+    input are treated literally. Returns None if there is nothing to match.
+    """
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if not terms:
+        return None
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_books(text, after=None, limit=20, fields=None):
+    """
+    Full-text search over name, author_name, category and description,
+    ordered by BM25 relevance. `after` is the (score, books_id) pair of the
+    last row of the previous page. Rows are the get_all_books_with_static(fields)
+    columns followed by a snippet and the BM25 score (lower is better).
+    """
+    match = fts_match_expression(text)
+    if match is None:
+        return []
+    query = books_select(
+        fields, 'books_fts f JOIN books b ON b.books_id = f.rowid',
+        ["snippet(books_fts, -1, '<b>', '</b>', '...', 16)", 'bm25(books_fts)'])
+    query += ' WHERE books_fts MATCH ?'
+    params = [match]
+    if after is not None:
+        query += ' AND (bm25(books_fts), f.rowid) > (?, ?)'
+        params.extend(after)
+    query += ' ORDER BY bm25(books_fts), f.rowid LIMIT ?'
+    params.append(limit)
+
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def get_catalog_revision():
+    """
+    Retrieve the catalog version without touching any book rows.
+    Returns (books revision, books_static revision, last modified unix time).
+    """
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT b.revision, s.revision, MAX(b.updated_at, s.updated_at)
+            FROM catalog_revision b, {STATIC_SCHEMA}.catalog_revision s
+        ''')
+        return cursor.fetchone()
+
+
+def get_book_changes(since, limit=100):
+    """
+    Retrieve books whose row changed after the given books revision, in
+    revision order. Rows are (revision, deleted) followed by the
+    get_all_books_with_static() columns, which are NULL for deleted books,
+    and by the revision the book was last inserted at (NULL if unknown).
+    """
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT c.revision, b.books_id IS NULL,
+                   c.books_id, b.name, b.author_name, b.category, b.description,
+                   s.books_id IS NOT NULL, s.picture_url, s.download_url, c.created_revision
+            FROM books_changes c
+            LEFT JOIN books b ON b.books_id = c.books_id
+            LEFT JOIN {STATIC_SCHEMA}.books_static s ON s.books_id = c.books_id
+            WHERE c.revision > ?
+            ORDER BY c.revision
+            LIMIT ?
+        ''', (since, limit))
+        return cursor.fetchall()
+
+
+def get_static_changes(since, limit=100):
+    """
+    Retrieve books whose static resources changed after the given
+    books_static revision. Rows have the same shape as get_book_changes(),
+    with revisions taken from the books_static sequence.
+    """
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT c.revision, b.books_id IS NULL,
+                   c.books_id, b.name, b.author_name, b.category, b.description,
+                   s.books_id IS NOT NULL, s.picture_url, s.download_url, c.created_revision
+            FROM {STATIC_SCHEMA}.books_static_changes c
+            LEFT JOIN books b ON b.books_id = c.books_id
+            LEFT JOIN {STATIC_SCHEMA}.books_static s ON s.books_id = c.books_id
+            WHERE c.revision > ?
+            ORDER BY c.revision
+            LIMIT ?
+        ''', (since, limit))
+        return cursor.fetchall()
 
 
 def get_book_by_id(books_id):
     """
-    Retrieve a book by its ID.
+    Retrieve a book by its ID, served from the read-through cache.
+    """
+    return book_cache.get(books_id, load_book_by_id)
+
+
+def load_book_by_id(books_id):
+    """
+    Retrieve a book by its ID from the database, bypassing the cache.
     """
-    conn = sqlite3.connect(DATABASE_BOOKS_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM books WHERE books_id = ?', (books_id,))
-    book = cursor.fetchone()
-    conn.close()
-    return book
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM books WHERE books_id = ?', (books_id,))
+        return cursor.fetchone()
 
 
 def update_book(books_id, name=None, author_name=None, category=None, description=None):
     """
-    Update a book's details by its ID.
-    """
-    conn = sqlite3.connect(DATABASE_BOOKS_PATH)
-    cursor = conn.cursor()
-    try:
-        if name:
-            cursor.execute(
-                'UPDATE books SET name = ? WHERE books_id = ?', (name, books_id))
-        if author_name:
-            cursor.execute(
-                'UPDATE books SET author_name = ? WHERE books_id = ?', (author_name, books_id))
-        if category:
-            cursor.execute(
-                'UPDATE books SET category = ? WHERE books_id = ?', (category, books_id))
-        if description:
-            cursor.execute(
-                'UPDATE books SET description = ? WHERE books_id = ?', (description, books_id))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error updating book: {e}")
-        return False
-    finally:
-        conn.close()
+    Update a book's details by its ID. Empty values are left unchanged.
+    Returns True if the book was updated, False if no book has that ID
+    and None if the update failed.
+    """
+    fields = {'name': name, 'author_name': author_name,
+              'category': category, 'description': description}
+    return patch_book(books_id, {key: value for key, value in fields.items() if value})
+
+
+def patch_book(books_id, fields):
+    """
+    Set exactly the given columns of a book with a single UPDATE statement.
+    `fields` maps columns in BOOK_UPDATE_COLUMNS to their new values.
+    Returns True if the book was updated, False if no book has that ID
+    and None if the update failed.
+    """
+    columns = [column for column in BOOK_UPDATE_COLUMNS if column in fields]
+    if len(columns) != len(fields):
+        raise ValueError(f"Unsupported update columns: {set(fields) - set(columns)}")
+
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            if columns:
+                assignments = ', '.join(f'{column} = ?' for column in columns)
+                cursor.execute(
+                    f'UPDATE books SET {assignments} WHERE books_id = ?',
+                    [fields[column] for column in columns] + [books_id])
+                found = cursor.rowcount > 0
+            else:
+                cursor.execute('SELECT 1 FROM books WHERE books_id = ?', (books_id,))
+                found = cursor.fetchone() is not None
+            conn.commit()
+            book_cache.evict(books_id)
+            return found
+        except Exception as e:
+            print(f"Error updating book: {e}")
+            return None
+
+
+def upsert_book(books_id, name, author_name, category=None, description=None,
+                picture_url=None, download_url=None, with_static=False):
+    """
+    Create or fully overwrite a book with INSERT ... ON CONFLICT DO UPDATE,
+    in one transaction with its static resources when with_static is set
+    (missing URLs fall back to the defaults, like add_book_static()).
+    Returns 'created', 'updated' or 'unchanged', or None if it failed.
+    """
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT 1 FROM books WHERE books_id = ?', (books_id,))
+            existed = cursor.fetchone() is not None
+            cursor.execute(UPSERT_BOOK_SQL, (books_id, name, author_name, category, description))
+            changed = cursor.rowcount > 0
+            if with_static:
+                if picture_url is None:
+                    picture_url = DEFAULT_PICTURE_URL.replace("books_id", str(books_id))
+                if download_url is None:
+                    download_url = DEFAULT_DOWNLOAD_URL.replace("books_id", str(books_id))
+                cursor.execute(UPSERT_STATIC_SQL, (books_id, picture_url, download_url))
+                changed = changed or cursor.rowcount > 0
+            conn.commit()
+        except Exception as e:
+            print(f"Error upserting book: {e}")
+            conn.rollback()
+            return None
+
+    book_cache.evict(books_id)
+    static_cache.evict(books_id)
+    if not existed:
+        return 'created'
+    return 'updated' if changed else 'unchanged'
 
 
 def delete_book(books_id):
     """
     Delete a book by its ID.
     """
-    conn = sqlite3.connect(DATABASE_BOOKS_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('DELETE FROM books WHERE books_id = ?', (books_id,))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error deleting book: {e}")
-        return False
-    finally:
-        conn.close()
+    with get_connection(DATABASE_BOOKS_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('DELETE FROM books WHERE books_id = ?', (books_id,))
+            conn.commit()
+            book_cache.evict(books_id)
+            return True
+        except Exception as e:
+            print(f"Error deleting book: {e}")
+            return False
@@ -0,0 +1,100 @@
+import json
+import time
+from crud_books_data import get_book_changes, get_catalog_revision, get_static_changes
+
+# Seconds between checks of the catalog revision on a live stream
+EVENT_POLL_INTERVAL = 1
+
+# Change feed rows read per query while catching up
+EVENT_BATCH_SIZE = 100
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+
+# Seconds a stream stays open before the client is asked to reconnect, so
+# a stream never holds a worker indefinitely
+EVENT_STREAM_MAX_SECONDS = 300
+
+# Reconnect delay (ms) advertised to clients
+RETRY_INTERVAL = 3000
+
+
+def format_event(event_id, event, data):
+    """
+    Serialize one event in the text/event-stream format.
+    """
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def change_event(kind, change, since):
+    """
+    Name the event of a feed row read after revision `since`: a row
+    inserted after it is an add for this client, even if it was updated
+    again since. A row added and deleted in between is only a delete.
+    """
+    if change[1]:
+        return f"{kind}.delete"
+    created_revision = change[-1]
+    if created_revision is not None and created_revision > since:
+        return f"{kind}.add"
+    return f"{kind}.update"
+
+
+def read_changes(books_since, static_since, to_dict):
+    """
+    Yield (books revision, static revision, event, data) for every change
+    after the given revisions, books first, reading the feed in batches.
+    """
+    for fetch, kind in ((get_book_changes, 'book'), (get_static_changes, 'static')):
+        since = books_since if kind == 'book' else static_since
+        while True:
+            changes = fetch(books_since if kind == 'book' else static_since, EVENT_BATCH_SIZE)
+            for change in changes:
+                if kind == 'book':
+                    books_since = change[0]
+                else:
+                    static_since = change[0]
+                event = change_event(kind, change, since)
+                yield books_since, static_since, event, to_dict(change)
+            if len(changes) < EVENT_BATCH_SIZE:
+                break
+
+
+def stream_events(to_dict, since=None):
+    """
+    Generate the Server-Sent Events stream for one client from the change
+    feed. Event ids are "<books revision>.<static revision>" catalog
+    revisions, so a client can resume with Last-Event-ID on any worker
+    process, or after a restart; without one it starts at the current
+    revision. to_dict builds the data of each event from a feed row.
+
+    The feed keeps the latest change of each book, so a resumed client gets
+    the current state of every book changed since, not each intermediate
+    write. An id ahead of the catalog (e.g. the database was recreated)
+    gets a resync event and the stream restarts from the current revision.
+    """
+    books_revision, static_revision, _ = get_catalog_revision()
+    yield f"retry: {RETRY_INTERVAL}\n\n"
+    if since is None or since[0] > books_revision or since[1] > static_revision:
+        if since is not None:
+            yield "event: resync\ndata: {}\n\n"
+        since = books_revision, static_revision
+    books_since, static_since = since
+    # An id-only message sets the client's Last-Event-ID without an event
+    yield f"id: {books_since}.{static_since}\n\n"
+
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < EVENT_STREAM_MAX_SECONDS:
+        books_revision, static_revision, _ = get_catalog_revision()
+        if books_revision > books_since or static_revision > static_since:
+            for books_since, static_since, event, data in read_changes(
+                    books_since, static_since, to_dict):
+                yield format_event(f"{books_since}.{static_since}", event, data)
+            # Rows changed twice are only in the feed once; skip the gaps
+            books_since = max(books_since, books_revision)
+            static_since = max(static_since, static_revision)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+            yield f"id: {books_since}.{static_since}\n: keep-alive\n\n"
+            last_sent = time.monotonic()
+        time.sleep(EVENT_POLL_INTERVAL)
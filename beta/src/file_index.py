@@ -0,0 +1,386 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import magic
+
+# Bytes read at a time when hashing a file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Files written per transaction by reconcile()
+RECONCILE_BATCH_SIZE = 1000
+
+# Seconds a process may hold the reconcile lease of a folder without
+# writing a batch; a crashed reconcile is taken over once it expires
+RECONCILE_LEASE_SECONDS = 300
+
+# Seconds after a finished reconcile during which starting workers skip theirs
+RECONCILE_MIN_INTERVAL = 60
+
+# Columns list_files() can filter on; each is backed by an index
+FILE_FILTER_COLUMNS = ('ext', 'book_id')
+
+UPSERT_FILE_SQL = '''
+    INSERT OR REPLACE INTO files (folder, filename, book_id, ext, size, mtime, mime_type, sha256)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Take the reconcile lease of a folder unless another process holds it or
+# reconciled the folder recently; returns a row only when it was taken
+CLAIM_RECONCILE_SQL = '''
+    INSERT INTO reconcile_state (folder, owner, lease_expires, reconciled_at)
+    VALUES (:folder, :owner, :lease_expires, NULL)
+    ON CONFLICT (folder) DO UPDATE
+    SET owner = :owner, lease_expires = :lease_expires
+    WHERE lease_expires < :now
+      AND (reconciled_at IS NULL OR reconciled_at < :now - :min_interval)
+    RETURNING owner
+'''
+
+# Renew (or, with a NULL lease, release) the lease of its owner;
+# reconciled_at is set when the reconcile is done
+RENEW_RECONCILE_SQL = '''
+    UPDATE reconcile_state
+    SET lease_expires = COALESCE(:lease_expires, 0),
+        reconciled_at = COALESCE(:reconciled_at, reconciled_at)
+    WHERE folder = :folder AND owner = :owner
+'''
+
+
+def file_book_id(filename):
+    """
+    The book a file belongs to: files uploaded for a book are named
+    "<book_id>.<ext>", so it is the part before the first dot.
+    """
+    return filename.split('.', 1)[0] if '.' in filename else None
+
+
+def file_ext(filename):
+    """
+    The lowercased extension of a filename, or '' if it has none.
+    """
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def file_sha256(path):
+    """
+    Hash a file in chunks so large downloads are never fully in memory.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def describe_file(folder, filename, stat=None):
+    """
+    Build the index row of a file on disk.
+    """
+    path = os.path.join(folder, filename)
+    stat = stat or os.stat(path)
+    return (folder, filename, file_book_id(filename), file_ext(filename), stat.st_size,
+            stat.st_mtime, magic.from_file(path, mime=True), file_sha256(path))
+
+
+def scan_files(folder, after=None, filters=None):
+    """
+    Return list_files() rows read with os.scandir(), without MIME type or
+    hash, for a folder the index does not cover yet.
+    """
+    rows = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if after is not None and entry.name <= after:
+                continue
+            values = {'ext': file_ext(entry.name), 'book_id': file_book_id(entry.name)}
+            if any(values[column] != value for column, value in (filters or {}).items()):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                # Removed while we were scanning
+                continue
+            rows.append((entry.name, values['book_id'], stat.st_size, stat.st_mtime, None, None))
+    rows.sort()
+    return rows
+
+
+class FileIndex:
+    """
+    SQLite index of the files in the upload folders, holding filename,
+    book_id, size, mtime, MIME type and SHA-256 of each. Uploads and
+    deletes keep it current so listings never touch the filesystem;
+    reconcile() catches up with files changed behind the app's back.
+    Every worker process opens the same file, so all see the same index,
+    and a lease row lets only one of them reconcile a folder at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.Lock()
+        # Folders known to have been reconciled at least once
+        self._ready = set()
+
+    def _connection(self):
+        """
+        Return the per-process connection, creating the table on first use.
+        Must be called with the lock held.
+        """
+        if self._conn_pid != os.getpid():
+            # Never reuse a connection inherited through fork
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL').fetchall()
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('PRAGMA busy_timeout = 5000')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    folder TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    book_id TEXT,
+                    ext TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    mime_type TEXT,
+                    sha256 TEXT,
+                    PRIMARY KEY (folder, filename)
+                ) WITHOUT ROWID
+            ''')
+            for column in FILE_FILTER_COLUMNS:
+                conn.execute(f'''
+                    CREATE INDEX IF NOT EXISTS idx_files_{column}
+                    ON files (folder, {column}, filename)
+                ''')
+            # Per-folder revision, bumped by every change, for listing ETags
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS folder_revisions (
+                    folder TEXT PRIMARY KEY,
+                    revision INTEGER NOT NULL
+                )
+            ''')
+            for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS files_revision_{event.lower()}
+                    AFTER {event} ON files
+                    BEGIN
+                        INSERT INTO folder_revisions (folder, revision) VALUES ({row}.folder, 1)
+                        ON CONFLICT (folder) DO UPDATE SET revision = revision + 1;
+                    END
+                ''')
+            # Reconcile lease of each folder, and when it was last completed
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS reconcile_state (
+                    folder TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    lease_expires REAL NOT NULL,
+                    reconciled_at REAL
+                )
+            ''')
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def record(self, folder, filename):
+        """
+        Index (or re-index) a file just written to folder.
+        """
+        row = describe_file(folder, filename)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(UPSERT_FILE_SQL, row)
+            conn.commit()
+
+    def remove(self, folder, filename):
+        """
+        Drop a deleted file from the index.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM files WHERE folder = ? AND filename = ?', (folder, filename))
+            conn.commit()
+
+    def ready(self, folder):
+        """
+        Whether folder has been reconciled at least once, so the index
+        holds every file in it.
+        """
+        if folder in self._ready:
+            return True
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT reconciled_at FROM reconcile_state WHERE folder = ?', (folder,)).fetchone()
+        if row is None or row[0] is None:
+            return False
+        self._ready.add(folder)
+        return True
+
+    def list_files(self, folder, limit=None, after=None, filters=None):
+        """
+        Return (filename, book_id, size, mtime, mime_type, sha256) rows of
+        the indexed files in folder, ordered by filename. `after` is the
+        last filename of the previous page; `filters` maps columns in
+        FILE_FILTER_COLUMNS to exact values. Until folder is ready() the
+        rows come from scan_files() instead.
+        """
+        for column in filters or {}:
+            if column not in FILE_FILTER_COLUMNS:
+                raise ValueError(f"Unsupported filter column: {column}")
+        if not self.ready(folder):
+            rows = scan_files(folder, after, filters)
+            return rows if limit is None else rows[:limit]
+
+        clauses = ['folder = ?']
+        params = [folder]
+        for column, value in (filters or {}).items():
+            clauses.append(f'{column} = ?')
+            params.append(value)
+        if after is not None:
+            clauses.append('filename > ?')
+            params.append(after)
+        query = f'''
+            SELECT filename, book_id, size, mtime, mime_type, sha256
+            FROM files WHERE {' AND '.join(clauses)} ORDER BY filename
+        '''
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            return self._connection().execute(query, params).fetchall()
+
+    def book_files(self, folder, book_id):
+        """
+        Return the filenames of the files of a book in folder.
+        """
+        if not self.ready(folder):
+            return [row[0] for row in scan_files(folder, filters={'book_id': book_id})]
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT filename FROM files WHERE folder = ? AND book_id = ? ORDER BY filename',
+                (folder, book_id)).fetchall()
+        return [row[0] for row in rows]
+
+    def revision(self, folder):
+        """
+        Return a number that changes whenever a file of folder is indexed
+        or removed.
+        """
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT revision FROM folder_revisions WHERE folder = ?', (folder,)).fetchone()
+        return row[0] if row else 0
+
+    def _renew(self, conn, folder, owner, lease_expires, reconciled_at=None):
+        conn.execute(RENEW_RECONCILE_SQL, {
+            'folder': folder,
+            'owner': owner,
+            'lease_expires': lease_expires,
+            'reconciled_at': reconciled_at
+        })
+
+    def _claim(self, folder, owner):
+        """
+        Take the reconcile lease of folder. Returns False if another
+        process holds it or reconciled folder recently.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            claimed = conn.execute(CLAIM_RECONCILE_SQL, {
+                'folder': folder,
+                'owner': owner,
+                'lease_expires': now + RECONCILE_LEASE_SECONDS,
+                'now': now,
+                'min_interval': RECONCILE_MIN_INTERVAL
+            }).fetchall()
+            conn.commit()
+        return bool(claimed)
+
+    def _write(self, folder, owner, rows, removed=(), done=False):
+        """
+        Write a batch of reconcile results and renew the lease. Files are
+        checked again inside the write transaction, which record() and
+        remove() wait for: rows of files deleted or rewritten since they
+        were described, and removals of files that came back, are dropped,
+        so a concurrent upload or delete always wins.
+        """
+        def unchanged(row):
+            try:
+                stat = os.stat(os.path.join(folder, row[1]))
+            except OSError:
+                return False
+            return (stat.st_size, stat.st_mtime) == (row[4], row[5])
+
+        with self._lock:
+            conn = self._connection()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany(UPSERT_FILE_SQL, [row for row in rows if unchanged(row)])
+                conn.executemany('DELETE FROM files WHERE folder = ? AND filename = ?', [
+                    (folder, filename) for filename in removed
+                    if not os.path.exists(os.path.join(folder, filename))])
+                now = time.time()
+                if done:
+                    self._renew(conn, folder, owner, None, now)
+                else:
+                    self._renew(conn, folder, owner, now + RECONCILE_LEASE_SECONDS)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def reconcile(self, folder):
+        """
+        Bring the index of folder in line with os.scandir(). Only files
+        whose size or mtime changed are re-hashed. Returns the number of
+        files indexed and removed, or None if another process holds the
+        folder's lease or reconciled it in the last RECONCILE_MIN_INTERVAL
+        seconds, so starting workers do not all hash the same files.
+        """
+        owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        if not self._claim(folder, owner):
+            return None
+        try:
+            return self._reconcile(folder, owner)
+        except BaseException:
+            # Let the next process to start take over right away
+            with self._lock:
+                conn = self._connection()
+                self._renew(conn, folder, owner, None)
+                conn.commit()
+            raise
+
+    def _reconcile(self, folder, owner):
+        with self._lock:
+            indexed = {filename: (size, mtime) for filename, size, mtime in self._connection().execute(
+                'SELECT filename, size, mtime FROM files WHERE folder = ?', (folder,))}
+
+        updated = 0
+        rows = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if indexed.pop(entry.name, None) == (stat.st_size, stat.st_mtime):
+                    continue
+                try:
+                    rows.append(describe_file(folder, entry.name, stat))
+                except OSError:
+                    # Removed while we were scanning
+                    continue
+                if len(rows) >= RECONCILE_BATCH_SIZE:
+                    self._write(folder, owner, rows)
+                    updated += len(rows)
+                    rows = []
+        self._write(folder, owner, rows, indexed, done=True)
+        self._ready.add(folder)
+        return {"indexed": updated + len(rows), "removed": len(indexed)}
@@ -1,6 +1,9 @@
 # main.py
 from flask import Flask
 from flask_cors import CORS
+from compression import init_compression
+from db_pool import init_db_pool
+from encoders import init_encoders
 from create_db import initialize_databases
 from routes import setup_routes
 from serve import setup_file_serving
@@ -8,6 +11,12 @@ from serve import setup_file_serving
 app = Flask(__name__)
 CORS(app)
 
+# Use orjson for JSON responses when it is installed
+init_encoders(app)
+
+# Pool database connections per request
+init_db_pool(app)
+
 # Initialize the databases when the app starts
 initialize_databases()
 
@@ -17,5 +26,8 @@ setup_routes(app)
 # Set up file serving
 setup_file_serving(app)
 
+# Compress large responses
+init_compression(app)
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,241 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import jsonify, make_response, request
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on keys tracked by MemoryBackend; the least recently seen go first
+RATE_LIMIT_MAX_KEYS = 100000
+
+# Seconds between sweeps of expired rows by SQLiteBackend
+RATE_LIMIT_SWEEP_INTERVAL = 60
+
+# Seconds between warnings while the backend keeps failing
+RATE_LIMIT_ERROR_LOG_INTERVAL = 60
+
+# Window state of one key, rolled forward to the current window. Column
+# references in DO UPDATE SET read the row as it was before the update.
+_PREVIOUS = 'CASE window WHEN :window THEN previous WHEN :window - 1 THEN count ELSE 0 END'
+_CURRENT = 'CASE window WHEN :window THEN count ELSE 0 END'
+_ALLOWED = f'({_PREVIOUS}) * :weight + ({_CURRENT}) + 1 <= :limit'
+COUNT_SQL = f'''
+    INSERT INTO rate_limits (key, window, count, previous, allowed, expires)
+    VALUES (:key, :window, 1 <= :limit, 0, 1 <= :limit, :expires)
+    ON CONFLICT (key) DO UPDATE
+    SET window = :window,
+        previous = {_PREVIOUS},
+        count = ({_CURRENT}) + ({_ALLOWED}),
+        allowed = {_ALLOWED},
+        expires = :expires
+    RETURNING count, previous, allowed
+'''
+
+
+class MemoryBackend:
+    """
+    Window counts kept in this process. Evicts keys idle for two windows,
+    and keeps no more than max_keys.
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> [window, count, previous count, period], least recently seen first
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        """
+        Drop idle keys, and keys past max_keys, from the least recently
+        seen end. Must be called with the lock held.
+        """
+        while self._windows:
+            key, state = next(iter(self._windows.items()))
+            idle = state[0] < now // state[3] - 1
+            if not idle and len(self._windows) <= self.max_keys:
+                break
+            del self._windows[key]
+
+    def count(self, key, window, period, weight, limit, now):
+        """
+        Roll key forward to `window` and count one request if the weighted
+        total stays within limit. Returns (count, previous, allowed) after
+        the update.
+        """
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None:
+                state = self._windows[key] = [window, 0, 0, period]
+            else:
+                self._windows.move_to_end(key)
+            if state[0] != window:
+                state[2] = state[1] if state[0] == window - 1 else 0
+                state[1] = 0
+                state[0] = window
+            allowed = state[2] * weight + state[1] + 1 <= limit
+            if allowed:
+                state[1] += 1
+            self._evict(now)
+            return state[1], state[2], allowed
+
+
+class SQLiteBackend:
+    """
+    Window counts kept in a SQLite WAL table, shared by every process on
+    the host that uses the same file. Each request is one atomic UPSERT;
+    rows of idle keys are swept every RATE_LIMIT_SWEEP_INTERVAL seconds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._conn_pid = None
+        self._next_sweep = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """
+        Open the per-process connection and create the table.
+        Must be called with the lock held.
+        """
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Autocommit: every statement is its own transaction
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL').fetchall()
+        # Losing the last counts on a power cut is acceptable for rate limits
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA busy_timeout = 1000')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                allowed INTEGER NOT NULL,
+                expires REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limits_expires ON rate_limits (expires)')
+        return conn
+
+    def count(self, key, window, period, weight, limit, now):
+        """
+        Same contract as MemoryBackend.count().
+        """
+        with self._lock:
+            try:
+                if self._conn_pid != os.getpid():
+                    # Never reuse a connection inherited through fork
+                    self._conn = self._connect()
+                    self._conn_pid = os.getpid()
+                if now >= self._next_sweep:
+                    self._conn.execute('DELETE FROM rate_limits WHERE expires < ?', (now,))
+                    self._next_sweep = now + RATE_LIMIT_SWEEP_INTERVAL
+                count, previous, allowed = self._conn.execute(COUNT_SQL, {
+                    'key': repr(key),
+                    'window': window,
+                    'weight': weight,
+                    'limit': limit,
+                    # The row stops mattering once it is two windows old
+                    'expires': (window + 2) * period
+                }).fetchone()
+            except sqlite3.Error:
+                # Reopen on the next request in case the file was replaced
+                self._conn_pid = None
+                raise
+            return count, previous, bool(allowed)
+
+
+class RateLimiter:
+    """
+    Sliding-window counter rate limiter.
+
+    Each (scope, client) key only keeps its request count in the current
+    and in the previous fixed window; the previous count is weighted by how
+    much of it still overlaps the sliding window. Every check is O(1).
+    Counts live in a backend: MemoryBackend for a single process, or
+    SQLiteBackend to share limits between worker processes.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self._next_error_log = 0
+        self._suppressed_errors = 0
+
+    def _log_backend_error(self, name, error):
+        """
+        Warn that requests go unlimited, at most once per
+        RATE_LIMIT_ERROR_LOG_INTERVAL seconds, so a failing store does not
+        flood the log on every request.
+        """
+        now = time.monotonic()
+        if now < self._next_error_log:
+            self._suppressed_errors += 1
+            return
+        logger.warning("Rate limiter unavailable, not limiting %s: %s "
+                       "(%d similar errors suppressed)", name, error, self._suppressed_errors)
+        self._next_error_log = now + RATE_LIMIT_ERROR_LOG_INTERVAL
+        self._suppressed_errors = 0
+
+    def hit(self, key, limit, period):
+        """
+        Count one request for key against `limit` requests per `period`
+        seconds. Returns (allowed, remaining, reset): reset is the number
+        of seconds until the window ends, or until a request would be
+        allowed again when this one was refused.
+        """
+        now = time.time()
+        window = int(now // period)
+        elapsed = now / period - window
+        count, previous, allowed = self.backend.count(
+            key, window, period, 1 - elapsed, limit, now)
+
+        if allowed:
+            remaining = int(limit - previous * (1 - elapsed) - count)
+            reset = period * (1 - elapsed)
+        elif count < limit:
+            # The previous window's weight has to decay below the gap
+            remaining = 0
+            reset = period * (1 - (limit - count - 1) / previous - elapsed)
+        else:
+            # This window is exhausted; wait for it to become the previous one
+            remaining = 0
+            reset = period * (1 - elapsed) + period * max(0, 1 - (limit - 1) / count)
+        return allowed, max(0, remaining), max(1, math.ceil(reset))
+
+    def limit(self, limit, period, scope=None):
+        """
+        Decorator limiting a view to `limit` requests per `period` seconds
+        per client IP. Views sharing a scope share counters; the scope
+        defaults to the view name. Responses carry RateLimit-Limit,
+        RateLimit-Remaining and RateLimit-Reset headers. If the backend
+        fails (e.g. a locked or unreadable database) the request is let
+        through without them, so the limiter never breaks the view.
+        """
+        def decorator(f):
+            name = scope or f.__name__
+
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                try:
+                    allowed, remaining, reset = self.hit((name, request.remote_addr), limit, period)
+                except (sqlite3.Error, OSError) as e:
+                    self._log_backend_error(name, e)
+                    return f(*args, **kwargs)
+                if allowed:
+                    response = make_response(f(*args, **kwargs))
+                else:
+                    response = make_response(jsonify({'error': 'Rate limit exceeded'}), 429)
+                    response.headers['Retry-After'] = str(reset)
+                response.headers['RateLimit-Limit'] = str(limit)
+                response.headers['RateLimit-Remaining'] = str(remaining)
+                response.headers['RateLimit-Reset'] = str(reset)
+                return response
+            return decorated_function
+        return decorator
@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Maximum number of rows kept per cache
+CACHE_MAX_ENTRIES = 10000
+
+# Seconds a cached row is served before it is re-read
+CACHE_TTL = 300
+
+
+class ReadThroughCache:
+    """
+    Bounded LRU/TTL cache of rows read from one SQLite database file,
+    keyed by books_id.
+
+    Local writes evict their key. Writes from other processes are detected
+    through `PRAGMA data_version` on a dedicated watcher connection, whose
+    value changes whenever any other connection commits to the file; the
+    ids changed since the last check are then read from the database's
+    change feed table (see create_revision_tracking()) and only those are
+    evicted. Without a change feed the whole cache is dropped instead.
+    """
+
+    def __init__(self, path, changes_table=None, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.path = path
+        self.changes_table = changes_table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._watcher = None
+        self._watcher_pid = None
+        self._data_version = None
+        self._revision = None
+
+    def _changed_ids(self):
+        """
+        Return the ids changed since the last call, or None if they are
+        unknown (no change feed, or more than the cache can hold).
+        Must be called with the lock held.
+        """
+        if self.changes_table is None:
+            return None
+        try:
+            revision = self._watcher.execute(
+                f'SELECT MAX(revision) FROM {self.changes_table}').fetchone()[0] or 0
+            if self._revision is None:
+                self._revision = revision
+                return None
+            ids = [row[0] for row in self._watcher.execute(
+                f'SELECT books_id FROM {self.changes_table} '
+                f'WHERE revision > ? AND revision <= ? LIMIT ?',
+                (self._revision, revision, self.max_entries + 1))]
+        except sqlite3.Error:
+            # The feed does not exist yet
+            return None
+        self._revision = revision
+        return ids if len(ids) <= self.max_entries else None
+
+    def _check_data_version(self):
+        """
+        Evict what other connections changed since the last check.
+        Must be called with the lock held.
+        """
+        if self._watcher_pid != os.getpid():
+            # Never reuse a watcher connection inherited through fork
+            self._watcher = sqlite3.connect(self.path, check_same_thread=False)
+            self._watcher_pid = os.getpid()
+            self._data_version = None
+            self._revision = None
+        version = self._watcher.execute('PRAGMA data_version').fetchone()[0]
+        if self._data_version is None:
+            self._changed_ids()
+        elif version != self._data_version:
+            ids = self._changed_ids()
+            if ids is None:
+                self._entries.clear()
+                self._generation += 1
+                self.invalidations += 1
+            elif ids:
+                for books_id in ids:
+                    self._entries.pop(books_id, None)
+                self._generation += 1
+                self.invalidations += 1
+        self._data_version = version
+
+    def get(self, key, loader):
+        """
+        Return the cached value for key, calling loader(key) on a miss.
+        """
+        with self._lock:
+            self._check_data_version()
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader(key)
+
+        with self._lock:
+            # Skip storing if a write evicted entries while we were loading
+            if generation == self._generation:
+                self._entries[key] = (value, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def evict(self, key):
+        """
+        Remove one key after a local write.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        """
+        Return hit/miss counters for monitoring.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations
+            }
@@ -1,4 +1,6 @@
 import sqlite3
+from book_cache import ReadThroughCache
+from db_pool import get_connection
 
 # Path to the static books database
 DATABASE_STATIC_PATH = "database/books_static.db"
@@ -7,99 +9,154 @@ DATABASE_STATIC_PATH = "database/books_static.db"
 DEFAULT_PICTURE_URL = "http://localhost:3000/db/pictures/books_id.png"
 DEFAULT_DOWNLOAD_URL = "http://localhost:3000/db/downloads/books_id.pdf"
 
+# Columns patch_book_static() may set
+STATIC_UPDATE_COLUMNS = ("picture_url", "download_url")
+
+# Read-through cache in front of get_book_static()
+static_cache = ReadThroughCache(DATABASE_STATIC_PATH, 'books_static_changes')
+
+# Rows fetched per fetchmany() call when streaming
+STREAM_BATCH_SIZE = 500
+
 
 def add_book_static(books_id, picture_url=None, download_url=None):
     """
     Add static resources for a book by its ID.
     If URLs are not provided, use default URLs with the book ID.
     """
-    conn = sqlite3.connect(DATABASE_STATIC_PATH)
-    cursor = conn.cursor()
-    try:
-        # Set default URLs if none provided
-        if picture_url is None:
-            picture_url = DEFAULT_PICTURE_URL.replace("books_id", str(books_id))
-        if download_url is None:
-            download_url = DEFAULT_DOWNLOAD_URL.replace("books_id", str(books_id))
-
-        cursor.execute(
-            """
-            INSERT INTO books_static (books_id, picture_url, download_url)
-            VALUES (?, ?, ?)
-        """,
-            (books_id, picture_url, download_url),
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        print("Error: Static entry for this Book ID already exists.")
-        return False
-    finally:
-        conn.close()
+    with get_connection(DATABASE_STATIC_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            # Set default URLs if none provided
+            if picture_url is None:
+                picture_url = DEFAULT_PICTURE_URL.replace("books_id", str(books_id))
+            if download_url is None:
+                download_url = DEFAULT_DOWNLOAD_URL.replace("books_id", str(books_id))
+
+            cursor.execute(
+                """
+                INSERT INTO books_static (books_id, picture_url, download_url)
+                VALUES (?, ?, ?)
+            """,
+                (books_id, picture_url, download_url),
+            )
+            conn.commit()
+            static_cache.evict(books_id)
+            return True
+        except sqlite3.IntegrityError:
+            print("Error: Static entry for this Book ID already exists.")
+            return False
 
 
 def get_book_static(books_id):
     """
-    Retrieve static resources for a book by its ID.
+    Retrieve static resources for a book by its ID, served from the
+    read-through cache.
     """
-    conn = sqlite3.connect(DATABASE_STATIC_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM books_static WHERE books_id = ?", (books_id,))
-    static_data = cursor.fetchone()
-    conn.close()
-    return static_data
+    return static_cache.get(books_id, load_book_static)
+
+
+def load_book_static(books_id):
+    """
+    Retrieve static resources for a book by its ID from the database,
+    bypassing the cache.
+    """
+    with get_connection(DATABASE_STATIC_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM books_static WHERE books_id = ?", (books_id,))
+        return cursor.fetchone()
 
 
 def get_all_books_static():
     """
     Retrieve all static resources for books.
     """
-    conn = sqlite3.connect(DATABASE_STATIC_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM books_static")
-    static_data = cursor.fetchall()
-    conn.close()
-    return static_data
+    with get_connection(DATABASE_STATIC_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM books_static")
+        return cursor.fetchall()
+
+
+def iter_all_books_static(batch_size=STREAM_BATCH_SIZE):
+    """
+    Yield all static resources in batches of rows.
+    """
+    with get_connection(DATABASE_STATIC_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM books_static")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
 
 
 def update_book_static(books_id, picture_url=None, download_url=None):
     """
-    Update static resources for a book by its ID.
+    Update static resources for a book by its ID. None values are left
+    unchanged. Returns True if the resources were updated, False if the
+    book has no static resources and None if the update failed.
     """
-    conn = sqlite3.connect(DATABASE_STATIC_PATH)
-    cursor = conn.cursor()
-    try:
-        if picture_url is not None:
-            cursor.execute(
-                "UPDATE books_static SET picture_url = ? WHERE books_id = ?",
-                (picture_url, books_id),
-            )
-        if download_url is not None:
-            cursor.execute(
-                "UPDATE books_static SET download_url = ? WHERE books_id = ?",
-                (download_url, books_id),
-            )
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error updating static resources: {e}")
-        return False
-    finally:
-        conn.close()
+    fields = {"picture_url": picture_url, "download_url": download_url}
+    return patch_book_static(
+        books_id, {key: value for key, value in fields.items() if value is not None})
+
+
+def patch_book_static(books_id, fields, create=False):
+    """
+    Set exactly the given static resource columns with a single UPDATE.
+    `fields` maps columns in STATIC_UPDATE_COLUMNS to their new values.
+    Returns True if the resources were updated, False if the book has no
+    static resources and None if the update failed. With create=True a
+    missing row is inserted in the same statement, holding exactly the
+    given values (nulls included) and NULL for the other columns; no
+    default URLs are filled in.
+    """
+    columns = [column for column in STATIC_UPDATE_COLUMNS if column in fields]
+    if len(columns) != len(fields):
+        raise ValueError(f"Unsupported update columns: {set(fields) - set(columns)}")
+
+    with get_connection(DATABASE_STATIC_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            if create and columns:
+                assignments = ", ".join(f"{column} = excluded.{column}" for column in columns)
+                cursor.execute(
+                    f"INSERT INTO books_static (books_id, {', '.join(columns)}) "
+                    f"VALUES (?{', ?' * len(columns)}) "
+                    f"ON CONFLICT (books_id) DO UPDATE SET {assignments}",
+                    [books_id] + [fields[column] for column in columns],
+                )
+                found = True
+            elif columns:
+                assignments = ", ".join(f"{column} = ?" for column in columns)
+                cursor.execute(
+                    f"UPDATE books_static SET {assignments} WHERE books_id = ?",
+                    [fields[column] for column in columns] + [books_id],
+                )
+                found = cursor.rowcount > 0
+            else:
+                cursor.execute("SELECT 1 FROM books_static WHERE books_id = ?", (books_id,))
+                found = cursor.fetchone() is not None
+            conn.commit()
+            static_cache.evict(books_id)
+            return found
+        except Exception as e:
+            print(f"Error updating static resources: {e}")
+            return None
 
 
 def delete_book_static(books_id):
     """
     Delete static resources for a book by its ID.
     """
-    conn = sqlite3.connect(DATABASE_STATIC_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("DELETE FROM books_static WHERE books_id = ?", (books_id,))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"Error deleting static resources: {e}")
-        return False
-    finally:
-        conn.close()
+    with get_connection(DATABASE_STATIC_PATH) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM books_static WHERE books_id = ?", (books_id,))
+            conn.commit()
+            static_cache.evict(books_id)
+            return True
+        except Exception as e:
+            print(f"Error deleting static resources: {e}")
+            return False
@@ -0,0 +1,86 @@
+from flask import Response, current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+# Optional fast serializers; the app falls back to the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Media types negotiated through the Accept header
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson. Calls with extra json.dumps()
+    arguments, values orjson cannot encode and pretty-printed (debug)
+    responses go through the standard library instead.
+    """
+
+    def _options(self):
+        return orjson.OPT_SORT_KEYS if self.sort_keys else 0
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs:
+            try:
+                return orjson.dumps(obj, option=self._options()).decode()
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, option=self._options())
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def wants_msgpack():
+    """
+    Whether the client prefers MessagePack to JSON in its Accept header.
+    Always False when msgpack is not installed.
+    """
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match([JSON_MIMETYPE, *MSGPACK_MIMETYPES])
+    return best in MSGPACK_MIMETYPES
+
+
+def encode_response(payload):
+    """
+    Serialize a response body in the format negotiated from the Accept
+    header: MessagePack when preferred, JSON (through app.json) otherwise.
+    Tuples are encoded as arrays by both.
+    """
+    if wants_msgpack():
+        response = Response(msgpack.packb(payload), mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = current_app.json.response(payload)
+    response.vary.add('Accept')
+    return response
+
+
+def init_encoders(app):
+    """
+    Serialize every JSON response of the app with orjson when it is
+    installed, unless disabled with FAST_JSON = False.
+    """
+    if orjson is not None and app.config.get('FAST_JSON', True):
+        app.json = OrjsonProvider(app)
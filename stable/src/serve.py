@@ -1,10 +1,12 @@
-from flask import request, jsonify, send_from_directory
+from flask import make_response, request, jsonify, send_from_directory
 from werkzeug.utils import secure_filename
 import os
 import magic
-import time
-from functools import wraps
 import logging
+import threading
+from file_index import FILE_FILTER_COLUMNS, FileIndex
+from compression import get_precompressed
+from rate_limiter import MemoryBackend, RateLimiter, SQLiteBackend
 
 
 def setup_file_serving(app):
@@ -20,15 +22,42 @@ def setup_file_serving(app):
     os.makedirs(PICTURES_FOLDER, exist_ok=True)
     os.makedirs(DOWNLOADS_FOLDER, exist_ok=True)
 
+    # Listings are answered from the index instead of the filesystem. One
+    # worker catches up in the background with files changed while the app
+    # was down; the others find its lease and skip. Listings read the disk
+    # until a folder has been reconciled once
+    file_index = FileIndex(app.config.get('FILE_INDEX_DATABASE', 'database/file_index.db'))
+    for folder in (PICTURES_FOLDER, DOWNLOADS_FOLDER):
+        threading.Thread(target=file_index.reconcile, args=(folder,), daemon=True).start()
+
     # Configuration
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_PICTURE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     ALLOWED_DOWNLOAD_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'zip', 'rar'}
 
+    # Pagination limits for file listings
+    DEFAULT_FILE_PAGE_SIZE = 100
+    MAX_FILE_PAGE_SIZE = 1000
+
     # Rate limiting configuration
     RATE_LIMIT = 100  # requests
     RATE_TIME = 3600  # seconds (1 hour)
-    request_history = {}
+    # Per-route (requests, seconds), keyed by view name
+    RATE_LIMITS = {
+        'serve_picture': (RATE_LIMIT, RATE_TIME),
+        'serve_download': (RATE_LIMIT, RATE_TIME),
+        'handle_pictures': (RATE_LIMIT, RATE_TIME),
+        'handle_downloads': (RATE_LIMIT, RATE_TIME),
+        'delete_book_assets': (RATE_LIMIT, RATE_TIME)
+    }
+    RATE_LIMITS.update(app.config.get('RATE_LIMITS', {}))
+    # Counts are shared by every worker process through SQLite unless
+    # RATE_LIMIT_BACKEND = 'memory'
+    RATE_LIMIT_DATABASE = app.config.get('RATE_LIMIT_DATABASE', 'database/rate_limits.db')
+    if app.config.get('RATE_LIMIT_BACKEND', 'sqlite') == 'memory':
+        limiter = RateLimiter(MemoryBackend())
+    else:
+        limiter = RateLimiter(SQLiteBackend(RATE_LIMIT_DATABASE))
 
     def is_valid_file_type(file, folder_type):
         """Validate file type using magic numbers"""
@@ -54,22 +83,70 @@ def setup_file_serving(app):
         return ext in ALLOWED_DOWNLOAD_EXTENSIONS
 
     def rate_limit(f):
-        """Rate limiting decorator"""
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            ip = request.remote_addr
-            current_time = time.time()
-
-            # Clean up old requests
-            request_history[ip] = [t for t in request_history.get(ip, [])
-                                   if current_time - t < RATE_TIME]
-
-            if len(request_history.get(ip, [])) >= RATE_LIMIT:
-                return jsonify({'error': 'Rate limit exceeded'}), 429
+        """Rate limiting decorator using the route's entry in RATE_LIMITS"""
+        limit, period = RATE_LIMITS.get(f.__name__, (RATE_LIMIT, RATE_TIME))
+        return limiter.limit(limit, period)(f)
+
+    def list_files(folder, folder_type):
+        """List indexed files, optionally paginated and filtered with ?limit=&after=&ext=&book_id="""
+        # Until the first reconcile is done the listing is read from disk, and
+        # the index revision does not describe it
+        etag = f"{folder_type}.{file_index.revision(folder)}" if file_index.ready(folder) else None
+        if etag and request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        # Compressed listing already built for this revision
+        cached = etag and get_precompressed(etag)
+        if cached:
+            cached.set_etag(etag, weak=True)
+            return cached
+
+        filters = {column: request.args[column]
+                   for column in FILE_FILTER_COLUMNS if column in request.args}
+        if 'ext' in filters:
+            filters['ext'] = filters['ext'].lower().lstrip('.')
+        paged = any(key in request.args for key in ['limit', 'after', *FILE_FILTER_COLUMNS])
+        limit = None
+        if paged:
+            limit = request.args.get('limit', DEFAULT_FILE_PAGE_SIZE)
+            if not str(limit).isdigit() or not 1 <= int(limit) <= MAX_FILE_PAGE_SIZE:
+                return jsonify({'error': f'limit must be between 1 and {MAX_FILE_PAGE_SIZE}'}), 400
+            limit = int(limit)
+
+        # Fetch one extra row to know whether another page exists
+        rows = file_index.list_files(
+            folder, limit + 1 if paged else None, request.args.get('after'), filters)
+        files = [{
+            'filename': name,
+            'url': f'/db/{folder_type}/{name}',
+            'book_id': book_id,
+            'size': size,
+            'modified': mtime,
+            'mime_type': mime_type,
+            'sha256': sha256
+        } for name, book_id, size, mtime, mime_type, sha256 in rows[:limit]]
+        if paged:
+            next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+            response = jsonify({'files': files, 'next_cursor': next_cursor})
+        else:
+            response = jsonify(files)
+        if etag:
+            response.set_etag(etag)
+        return response
 
-            request_history.setdefault(ip, []).append(current_time)
-            return f(*args, **kwargs)
-        return decorated_function
+    def delete_book_files(folder, book_id):
+        """Delete every file of a book in folder, found through the index"""
+        deleted_files = []
+        for filename in file_index.book_files(folder, book_id):
+            try:
+                os.remove(os.path.join(folder, filename))
+                deleted_files.append(filename)
+            except FileNotFoundError:
+                pass  # Already gone; just drop the stale entry
+            file_index.remove(folder, filename)
+        return deleted_files
 
     def handle_file_operation(folder, operation, filename=None, file=None, book_id=None):
         """Common file operation handler with book_id support"""
@@ -77,14 +154,7 @@ def setup_file_serving(app):
             folder_type = 'pictures' if folder == PICTURES_FOLDER else 'downloads'
 
             if operation == 'list':
-                files = os.listdir(folder)
-                files_with_urls = [{
-                    'filename': file,
-                    'url': f'/db/{folder_type}/{file}',
-                    'size': os.path.getsize(os.path.join(folder, file)),
-                    'modified': os.path.getmtime(os.path.join(folder, file))
-                } for file in files]
-                return jsonify(files_with_urls)
+                return list_files(folder, folder_type)
 
             elif operation in ['upload', 'update']:
                 if not file:
@@ -112,6 +182,7 @@ def setup_file_serving(app):
 
                 file_path = os.path.join(folder, filename)
                 file.save(file_path)
+                file_index.record(folder, filename)
 
                 return jsonify({
                     'message': f'File {"updated" if operation == "update" else "uploaded"} successfully',
@@ -119,14 +190,28 @@ def setup_file_serving(app):
                 }), 200 if operation == 'update' else 201
 
             elif operation == 'delete':
+                if book_id:
+                    # Delete all files of the book, found through the index
+                    deleted_files = delete_book_files(folder, book_id)
+                    if not deleted_files:
+                        return jsonify({'error': f'No files found for book_id {book_id}'}), 404
+                    return jsonify({
+                        'message': 'Files deleted successfully',
+                        'deleted_files': deleted_files
+                    }), 200
+
                 if not filename:
                     return jsonify({'error': 'Filename not provided'}), 400
 
-                file_path = os.path.join(folder, secure_filename(filename))
+                filename = secure_filename(filename)
+                file_path = os.path.join(folder, filename)
                 if not os.path.exists(file_path):
+                    # Drop any stale index entry
+                    file_index.remove(folder, filename)
                     return jsonify({'error': 'File not found'}), 404
 
                 os.remove(file_path)
+                file_index.remove(folder, filename)
                 return jsonify({'message': 'File deleted successfully'}), 200
 
         except Exception as e:
@@ -165,7 +250,12 @@ def setup_file_serving(app):
                 book_id=book_id
             )
         elif request.method == 'DELETE':
-            return handle_file_operation(PICTURES_FOLDER, 'delete', filename=request.args.get('filename'))
+            return handle_file_operation(
+                PICTURES_FOLDER,
+                'delete',
+                filename=request.args.get('filename'),
+                book_id=request.args.get('book_id')
+            )
         elif request.method == 'PUT':
             book_id = request.args.get('book_id')
             return handle_file_operation(
@@ -190,7 +280,12 @@ def setup_file_serving(app):
                 book_id=book_id
             )
         elif request.method == 'DELETE':
-            return handle_file_operation(DOWNLOADS_FOLDER, 'delete', filename=request.args.get('filename'))
+            return handle_file_operation(
+                DOWNLOADS_FOLDER,
+                'delete',
+                filename=request.args.get('filename'),
+                book_id=request.args.get('book_id')
+            )
         elif request.method == 'PUT':
             book_id = request.args.get('book_id')
             return handle_file_operation(
@@ -201,6 +296,20 @@ def setup_file_serving(app):
                 book_id=book_id
             )
 
+    @app.route('/assets/<book_id>', methods=['DELETE'])
+    @rate_limit
+    def delete_book_assets(book_id):
+        deleted_files = {
+            'pictures': delete_book_files(PICTURES_FOLDER, book_id),
+            'downloads': delete_book_files(DOWNLOADS_FOLDER, book_id)
+        }
+        if not any(deleted_files.values()):
+            return jsonify({'error': f'No files found for book_id {book_id}'}), 404
+        return jsonify({
+            'message': 'Files deleted successfully',
+            'deleted_files': deleted_files
+        }), 200
+
     @app.errorhandler(404)
     def not_found_error(error):
         return jsonify({'error': 'Not found'}), 404